@@ -0,0 +1,34 @@
+"""
+Helpers shared by the benchmarks.
+"""
+import shutil
+import tempfile
+
+import texfigure
+
+
+class MockPyTeX(object):
+    """
+    A stand-in for the PythonTeX utilities object, which does no tracking.
+    """
+
+    def add_dependencies(self, *files):
+        pass
+
+    def add_created(self, *files):
+        pass
+
+
+class ManagerBenchmark(object):
+    """
+    Base class for benchmarks which need a `~texfigure.Manager` in a
+    temporary directory.
+    """
+
+    def setup(self, *params):
+        self.base_path = tempfile.mkdtemp()
+        self.manager = texfigure.Manager(MockPyTeX(), self.base_path,
+                                         python_dir=False)
+
+    def teardown(self, *params):
+        shutil.rmtree(self.base_path)
@@ -0,0 +1,58 @@
+"""
+Benchmarks for generating LaTeX from `~texfigure.Figure` and
+`~texfigure.MultiFigure` objects.
+"""
+import texfigure
+from texfigure.registry import FigureRegistry
+
+
+class TimeFigure(object):
+    params = ['.pgf', '.pdf']
+    param_names = ['fext']
+
+    def setup(self, fext):
+        self.figure = texfigure.Figure('/tmp/Chapter1-Figure1-bench' + fext,
+                                       reference='bench')
+
+    def time_repr_figure(self, fext):
+        self.figure.repr_figure()
+
+    def time_repr_subfigure(self, fext):
+        self.figure.repr_subfigure()
+
+
+class TimeMultiFigure(object):
+    params = [4, 32, 128]
+    param_names = ['nrows']
+    ncols = 4
+
+    def setup(self, nrows):
+        self.figures = [texfigure.Figure('/tmp/Chapter1-Figure{}-f{}.pdf'.format(i, i),
+                                         reference='f{}'.format(i))
+                        for i in range(nrows * self.ncols)]
+        self.multi = texfigure.MultiFigure(nrows, self.ncols, reference='multi')
+        for figure in self.figures:
+            self.multi.append(figure)
+
+    def time_append(self, nrows):
+        multi = texfigure.MultiFigure(nrows, self.ncols, reference='multi')
+        for figure in self.figures:
+            multi.append(figure)
+
+    def time_repr_latex(self, nrows):
+        self.multi._repr_latex_()
+
+
+class MemFigure(object):
+
+    def mem_figure(self):
+        return texfigure.Figure('/tmp/Chapter1-Figure1-bench.pdf',
+                                reference='bench')
+
+    def mem_registered_figures(self):
+        registry = FigureRegistry()
+        for i in range(1000):
+            figure = texfigure.Figure('/tmp/Chapter1-Figure{}-f{}.pdf'.format(i, i),
+                                      reference='f{}'.format(i))
+            registry['f{}'.format(i)] = {'number': i, 'Figure': figure}
+        return registry._entries
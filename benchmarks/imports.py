@@ -0,0 +1,7 @@
+"""
+Benchmarks for the time taken to import texfigure.
+"""
+
+
+def timeraw_import_texfigure():
+    return "import texfigure"
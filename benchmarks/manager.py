@@ -0,0 +1,76 @@
+"""
+Benchmarks for saving figures and finding data files with a
+`~texfigure.Manager`.
+"""
+import os
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+from .common import ManagerBenchmark
+
+
+class TimeSaveFigure(ManagerBenchmark):
+    params = ([10, 1000, 100000], ['.pgf', '.pdf', '.png'])
+    param_names = ['npoints', 'fext']
+
+    def setup(self, npoints, fext):
+        super(TimeSaveFigure, self).setup(npoints, fext)
+        self.fig, ax = plt.subplots()
+        ax.plot(np.random.random(npoints))
+        ax.set_xlabel("Sample")
+        ax.set_ylabel("Value")
+
+    def teardown(self, npoints, fext):
+        plt.close(self.fig)
+        super(TimeSaveFigure, self).teardown(npoints, fext)
+
+    def time_save_figure(self, npoints, fext):
+        self.manager.save_figure('bench', self.fig, fext=fext)
+
+
+class TimeDataFile(ManagerBenchmark):
+    params = [100, 10000]
+    param_names = ['nfiles']
+
+    def setup(self, nfiles):
+        super(TimeDataFile, self).setup(nfiles)
+        for i in range(nfiles):
+            with open(os.path.join(self.manager.data_dir,
+                                   'snapshot{:05d}.npy'.format(i)), 'w'):
+                pass
+
+    def time_data_file_name(self, nfiles):
+        self.manager.data_file('snapshot00042.npy')
+
+    def time_data_file_pattern(self, nfiles):
+        self.manager.data_file('snapshot0004*.npy')
+
+    def time_data_file_repeated(self, nfiles):
+        for i in range(100):
+            self.manager.data_file('snapshot{:05d}.npy'.format(i % nfiles))
+
+
+class TimeSaveRaster(ManagerBenchmark):
+    """
+    Saving raster formats through the pgf backend, which compiles the
+    figure with LaTeX and converts the PDF, compared to routing them to Agg.
+    """
+    params = (['.png', '.jpg'], ['pgf', 'agg'])
+    param_names = ['fext', 'backend']
+
+    def setup(self, fext, backend):
+        super(TimeSaveRaster, self).setup(fext, backend)
+        if backend == 'pgf':
+            self.manager.extension_backends = {}
+        self.fig, ax = plt.subplots()
+        ax.plot(np.random.random(1000))
+        ax.set_xlabel("Sample")
+        ax.set_ylabel("Value")
+
+    def teardown(self, fext, backend):
+        plt.close(self.fig)
+        super(TimeSaveRaster, self).teardown(fext, backend)
+
+    def time_save_raster(self, fext, backend):
+        self.manager.save_figure('bench', self.fig, fext=fext)
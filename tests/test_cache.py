@@ -0,0 +1,85 @@
+import os
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from texfigure.cache import RenderCache, figure_fingerprint
+
+
+def _write(filename, data):
+    with open(filename, 'wb') as fobj:
+        fobj.write(data)
+
+
+def _read(filename):
+    with open(filename, 'rb') as fobj:
+        return fobj.read()
+
+
+def _figure(y=(1, 2, 3)):
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    ax.plot(y, label='line')
+    ax.scatter([1, 2], [3, 4])
+    fig.colorbar(ax.imshow(np.eye(3)))
+    ax.set_xlabel('x')
+    ax.legend()
+    return fig
+
+
+def test_fingerprint_same_figure(tmpdir):
+    cache = RenderCache(str(tmpdir))
+    key = cache.key(figure_fingerprint(_figure()), 'plot.pdf', {})
+    assert key == cache.key(figure_fingerprint(_figure()), 'plot.pdf', {})
+    assert key != cache.key(figure_fingerprint(_figure()), 'plot.png', {})
+    assert key != cache.key(figure_fingerprint(_figure()), 'plot.pdf',
+                            {'dpi': 100})
+
+
+def test_fingerprint_after_save(tmpdir):
+    fig = _figure()
+    fingerprint = figure_fingerprint(fig)
+    fig.savefig(os.path.join(str(tmpdir), 'plot.png'))
+    assert figure_fingerprint(fig) == fingerprint
+    fig.savefig(os.path.join(str(tmpdir), 'plot.svg'))
+    assert figure_fingerprint(fig) == fingerprint
+
+
+def test_fingerprint_changed_data():
+    fingerprint = figure_fingerprint(_figure())
+    assert len(fingerprint) == 20
+    assert figure_fingerprint(_figure((1, 2, 4))) != fingerprint
+
+    fig = _figure()
+    fig.axes[0].set_title('title')
+    assert figure_fingerprint(fig) != fingerprint
+
+
+def test_fetch_store(tmpdir):
+    cache = RenderCache(os.path.join(str(tmpdir), 'cache'))
+    assert cache.fetch('missing', os.path.join(str(tmpdir), 'plot.pgf')) is None
+
+    src = tmpdir.mkdir('src')
+    pgf = os.path.join(str(src), 'plot.pgf')
+    _write(pgf, b'\\pgfimage{plot-img0.png}\\pgfimage{plot-img1.png}')
+    _write(os.path.join(str(src), 'plot-img0.png'), b'image 0')
+    _write(os.path.join(str(src), 'plot-img1.png'), b'image 1')
+    _write(os.path.join(str(src), 'other-img0.png'), b'other')
+    cache.store('key', pgf)
+
+    dst = tmpdir.mkdir('dst')
+    fetched = cache.fetch('key', os.path.join(str(dst), 'plot.pgf'))
+    assert fetched == os.path.join(str(dst), 'plot.pgf')
+    assert sorted(os.listdir(str(dst))) == ['plot-img0.png', 'plot-img1.png',
+                                            'plot.pgf']
+    for name in os.listdir(str(dst)):
+        assert _read(os.path.join(str(dst), name)) == _read(
+            os.path.join(str(src), name))
+
+    # Storing the same key again leaves the first entry.
+    _write(pgf, b'changed')
+    cache.store('key', pgf)
+    cache.fetch('key', fetched)
+    assert _read(fetched) != b'changed'
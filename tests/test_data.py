@@ -0,0 +1,106 @@
+import os
+
+import numpy as np
+
+from texfigure.data import (DirectoryIndex, iter_chunks, StreamingHistogram,
+                            StreamingHistogram2D, StreamingBinnedStatistic)
+
+
+def _touch(*parts):
+    with open(os.path.join(*parts), 'w'):
+        pass
+
+
+def test_directory_index_find(tmpdir):
+    root = str(tmpdir)
+    os.mkdir(os.path.join(root, 'sub'))
+    for name in ('a.npy', 'b.npy', 'c.txt', '.hidden.npy'):
+        _touch(root, name)
+    _touch(root, 'sub', 'd.npy')
+
+    index = DirectoryIndex(root)
+    assert index.find('a.npy') == [os.path.join(root, 'a.npy')]
+    assert index.find('missing.npy') == []
+    assert index.find('*.npy') == [os.path.join(root, 'a.npy'),
+                                   os.path.join(root, 'b.npy')]
+    assert index.find('sub/*.npy') == [os.path.join(root, 'sub', 'd.npy')]
+    assert index.find('*/d.npy') == [os.path.join(root, 'sub', 'd.npy')]
+
+
+def test_directory_index_refresh(tmpdir):
+    root = str(tmpdir)
+    _touch(root, 'a.npy')
+
+    index = DirectoryIndex(root)
+    assert len(index.find('*.npy')) == 1
+
+    _touch(root, 'b.npy')
+    index.refresh()
+    assert len(index.find('*.npy')) == 2
+
+
+def test_iter_chunks_npy(tmpdir):
+    filename = os.path.join(str(tmpdir), 'data.npy')
+    data = np.arange(30.).reshape(10, 3)
+    np.save(filename, data)
+
+    chunks = list(iter_chunks(filename, chunk_size=4, columns=[0, 2]))
+    assert [len(chunk) for chunk in chunks] == [4, 4, 2]
+    assert np.all(np.concatenate(chunks) == data[:, [0, 2]])
+
+
+def test_iter_chunks_csv(tmpdir):
+    filename = os.path.join(str(tmpdir), 'data.csv')
+    data = np.arange(30.).reshape(10, 3)
+    np.savetxt(filename, data, delimiter=',', header='a,b,c')
+
+    chunks = list(iter_chunks(filename, chunk_size=3, skiprows=1))
+    assert [len(chunk) for chunk in chunks] == [3, 3, 3, 1]
+    assert np.all(np.concatenate(chunks) == data)
+
+
+def test_streaming_histograms():
+    x, y = np.random.RandomState(0).rand(2, 1000)
+
+    hist = StreamingHistogram(10, (0, 1))
+    hist2d = StreamingHistogram2D(5, [(0, 1), (0, 1)])
+    for start in range(0, 1000, 300):
+        hist.add(x[start:start + 300])
+        hist2d.add(x[start:start + 300], y[start:start + 300])
+
+    assert np.all(hist.counts == np.histogram(x, 10, (0, 1))[0])
+    assert np.all(hist2d.counts ==
+                  np.histogram2d(x, y, 5, [(0, 1), (0, 1)])[0])
+
+
+def test_streaming_binned_statistic():
+    x = np.array([0., 0.1, 0.6, 1., 2.])
+    values = np.array([1., 3., 5., 7., 100.])
+
+    for statistic, expected in [('count', [2, 2]), ('sum', [4, 12]),
+                                ('mean', [2, 6]), ('std', [1, 1]),
+                                ('min', [1, 5]), ('max', [3, 7])]:
+        binned = StreamingBinnedStatistic([2], [(0, 1)], statistic=statistic)
+        binned.add(x[:2], values[:2])
+        binned.add(x[2:], values[2:])
+        assert np.allclose(binned.result, expected)
+
+    binned = StreamingBinnedStatistic([2, 2], [(0, 1), (0, 1)])
+    binned.add([x, x], values)
+    assert np.isnan(binned.result[0, 1])
+    assert np.allclose(binned.result[[0, 1], [0, 1]], [2, 6])
+
+
+def test_streaming_binned_statistic_std_offset():
+    # The sum of squares of values near 1e8 loses all the precision of a
+    # spread of 1.
+    values = 1e8 + np.random.RandomState(0).randn(1000000)
+    x = np.linspace(0, 1, len(values))
+
+    binned = StreamingBinnedStatistic([2], [(0, 1)], statistic='std')
+    for start in range(0, len(values), 300000):
+        binned.add(x[start:start + 300000], values[start:start + 300000])
+
+    assert np.allclose(binned.result, 1, atol=0.01)
+    assert np.allclose(binned.result, [values[x <= 0.5].std(),
+                                       values[x > 0.5].std()])
@@ -0,0 +1,88 @@
+import numpy as np
+import matplotlib.pyplot as plt
+
+from texfigure.decimate import minmax_indices, lttb_indices, decimate_lines
+
+
+def test_minmax_indices():
+    y = np.random.RandomState(0).randn(100000)
+    indices = minmax_indices(y, 1000)
+
+    assert len(indices) <= 1000
+    assert indices[0] == 0
+    assert indices[-1] == len(y) - 1
+    assert np.all(np.diff(indices) > 0)
+    assert y[indices].max() == y.max()
+    assert y[indices].min() == y.min()
+
+
+def test_lttb_indices():
+    x = np.linspace(0, 10, 100000)
+    y = np.sin(x)
+    indices = lttb_indices(x, y, 500)
+
+    assert len(indices) == 500
+    assert indices[0] == 0
+    assert indices[-1] == len(x) - 1
+    assert np.all(np.diff(indices) > 0)
+
+
+def test_short_data_unchanged():
+    y = np.arange(10.)
+    assert np.all(minmax_indices(y, 100) == np.arange(10))
+    assert np.all(lttb_indices(y, y, 100) == np.arange(10))
+
+
+def test_decimate_lines_restores():
+    fig, ax = plt.subplots(figsize=(4, 3))
+    x = np.arange(100000.)
+    line, = ax.plot(x, np.random.RandomState(0).randn(len(x)))
+    markers, = ax.plot(x, x, 'o')
+
+    with decimate_lines(fig, 'minmax', dpi=100) as lines:
+        assert lines == [line]
+        assert len(line.get_xdata()) <= 2 * 4 * 100
+        assert len(markers.get_xdata()) == len(x)
+
+    assert len(line.get_xdata()) == len(x)
+    plt.close(fig)
+
+
+def test_minmax_indices_uneven_x():
+    # Half the points are bunched into the first tenth of the range, so
+    # equal length chunks of the index would not match the pixels.
+    rng = np.random.RandomState(0)
+    x = np.concatenate((np.linspace(0, 1, 50000, endpoint=False),
+                        np.linspace(1, 10, 50000)))
+    y = rng.randn(len(x))
+    indices = minmax_indices(y, 200, x=x)
+
+    assert len(indices) <= 200
+    assert np.all(np.diff(indices) > 0)
+    edges = np.linspace(0, 10, 99 + 1)
+    for low, high in zip(edges[:-1], edges[1:]):
+        inside = (x >= low) & (x < high)
+        kept = y[indices][(x[indices] >= low) & (x[indices] < high)]
+        assert kept.max() == y[inside].max()
+        assert kept.min() == y[inside].min()
+
+
+def test_decimate_lines_view_limits():
+    x = np.arange(1000000.)
+    y = np.sin(x / 100.)
+
+    for method in ('minmax', 'lttb'):
+        fig, ax = plt.subplots(figsize=(4, 3))
+        line, = ax.plot(x, y)
+        ax.set_xlim(0, 2000)
+
+        with decimate_lines(fig, method, dpi=100):
+            xd, yd = line.get_xdata(), line.get_ydata()
+            visible = (xd >= 0) & (xd <= 2000)
+            assert len(xd) <= 2 * 4 * 100
+            assert visible.sum() > 100
+            # One point past the limit keeps the line drawn to the edge.
+            assert xd[-1] > 2000
+            assert np.ptp(yd[visible]) > 1.9
+
+        plt.close(fig)
@@ -0,0 +1,107 @@
+import os
+
+import matplotlib.pyplot as plt
+
+import texfigure
+from texfigure.dependencies import DependencyGraph
+
+
+class MockPyTeX(object):
+
+    def __init__(self):
+        self.dependencies = []
+        self.created = []
+
+    def add_dependencies(self, *files):
+        self.dependencies.extend(files)
+
+    def add_created(self, *files):
+        self.created.extend(files)
+
+
+def _write(filename, content):
+    with open(filename, 'w') as fobj:
+        fobj.write(content)
+
+
+def _graph(tmpdir):
+    data = os.path.join(str(tmpdir), 'data.txt')
+    output = os.path.join(str(tmpdir), 'plot.pdf')
+    _write(data, '1 2 3')
+    _write(output, 'figure')
+
+    graph = DependencyGraph(os.path.join(str(tmpdir), 'graph.json'))
+    graph.record('plot', [data], code='abc', outputs=[output])
+    return graph, data, output
+
+
+def test_up_to_date(tmpdir):
+    graph, data, output = _graph(tmpdir)
+    assert graph.is_up_to_date('plot', 'abc')
+    assert not graph.is_up_to_date('other', 'abc')
+    assert not graph.is_up_to_date('plot', None)
+
+    graph = DependencyGraph(graph.filename)
+    assert graph.is_up_to_date('plot', 'abc')
+    assert graph.files('plot') == [data]
+    assert graph.outputs('plot') == [output]
+
+
+def test_up_to_date_touched(tmpdir):
+    graph, data, _ = _graph(tmpdir)
+    mtime = os.stat(data).st_mtime
+    os.utime(data, (mtime + 10, mtime + 10))
+    assert graph.is_up_to_date('plot', 'abc')
+
+    graph.hash_size_limit = 0
+    graph.record('plot', [data], code='abc', outputs=graph.outputs('plot'))
+    os.utime(data, (mtime + 20, mtime + 20))
+    assert not graph.is_up_to_date('plot', 'abc')
+
+
+def test_up_to_date_changed_data(tmpdir):
+    graph, data, _ = _graph(tmpdir)
+    mtime = os.stat(data).st_mtime
+    _write(data, '1 2 4')
+    os.utime(data, (mtime + 10, mtime + 10))
+    assert not graph.is_up_to_date('plot', 'abc')
+
+    os.remove(data)
+    assert not graph.is_up_to_date('plot', 'abc')
+
+
+def test_up_to_date_changed_code(tmpdir):
+    graph, _, _ = _graph(tmpdir)
+    assert not graph.is_up_to_date('plot', 'abd')
+
+
+def test_up_to_date_missing_output(tmpdir):
+    graph, _, output = _graph(tmpdir)
+    os.remove(output)
+    assert not graph.is_up_to_date('plot', 'abc')
+
+
+def test_manager_records_only_when_needed(tmpdir):
+    data_dir = tmpdir.mkdir('Data')
+    _write(str(data_dir.join('values.txt')), '1 2 3')
+    manager = texfigure.Manager(MockPyTeX(), str(tmpdir), python_dir=False,
+                                data_dir=True, cache_dir=True)
+
+    fig = plt.figure()
+    manager.data_file('values.txt')
+    manager.save_figure('plain', fig, fext='.png')
+    assert 'plain' not in manager._dependency_graph
+    assert manager._touched_files == []
+
+    # A figure saved in the scope of another figure is not recorded either.
+    with manager.figure('other'):
+        manager.data_file('values.txt')
+        manager.save_figure('inner', fig, fext='.png')
+    assert 'inner' not in manager._dependency_graph
+
+    with manager.figure('scoped'):
+        manager.data_file('values.txt')
+        manager.save_figure('scoped', fig, fext='.png')
+    plt.close(fig)
+    assert manager._dependency_graph.files('scoped') == [
+        os.path.join(str(data_dir), 'values.txt')]
@@ -0,0 +1,139 @@
+import os
+
+import pytest
+
+import texfigure
+from texfigure import externalize
+
+
+class MockPyTeX(object):
+
+    def __init__(self):
+        self.dependencies = []
+        self.created = []
+
+    def add_dependencies(self, *files):
+        self.dependencies.extend(files)
+
+    def add_created(self, *files):
+        self.created.extend(files)
+
+
+def _write(filename, data):
+    with open(filename, 'w') as fobj:
+        fobj.write(data)
+
+
+def _read(filename):
+    with open(filename) as fobj:
+        return fobj.read()
+
+
+@pytest.fixture
+def latex_runs(monkeypatch):
+    """
+    Replace LaTeX with a function writing the names of the figures on each
+    page, and return the list of the batches compiled.
+    """
+    runs = []
+
+    def run_latex(pgf_files, texsystem, preamble, build_dir, jobname):
+        runs.append(list(pgf_files))
+        filename = os.path.join(build_dir, jobname + '.pdf')
+        _write(filename, '\n'.join(str(pgf_file) for pgf_file in pgf_files))
+        return filename
+
+    def split_pages(filename, outputs, splitter):
+        for page, output in zip(_read(filename).splitlines(), outputs):
+            _write(output, page)
+
+    monkeypatch.setattr(externalize, '_run_latex', run_latex)
+    monkeypatch.setattr(externalize, '_split_pages', split_pages)
+    monkeypatch.setattr(externalize, '_pdf_splitter', lambda: (None, None))
+    return runs
+
+
+def _pgf_files(tmpdir, n):
+    files = []
+    for i in range(n):
+        filename = os.path.join(str(tmpdir), 'fig{}.pgf'.format(i))
+        _write(filename, 'figure {}'.format(i))
+        files.append(filename)
+    return files
+
+
+def test_compile_pgf(tmpdir, latex_runs):
+    cache_dir = os.path.join(str(tmpdir), 'cache')
+    pgf_files = _pgf_files(tmpdir, 3)
+    files = [(pgf_file, externalize.external_filename(pgf_file))
+             for pgf_file in pgf_files]
+
+    compiled = externalize.compile_pgf(files, cache_dir=cache_dir,
+                                       texsystem='pdflatex', preamble='')
+    assert compiled == [pdf_file for _, pdf_file in files]
+    assert latex_runs == [pgf_files]
+    for pgf_file, pdf_file in files:
+        assert _read(pdf_file) == pgf_file
+
+    _write(pgf_files[1], 'changed')
+    compiled = externalize.compile_pgf(files, cache_dir=cache_dir,
+                                       texsystem='pdflatex', preamble='')
+    assert compiled == [files[1][1]]
+    assert latex_runs[1:] == [[pgf_files[1]]]
+
+
+def test_compile_pgf_no_splitter(tmpdir, latex_runs, monkeypatch):
+    monkeypatch.setattr(externalize, '_pdf_splitter', lambda: None)
+    assert not externalize.can_split_pages()
+
+    pgf_file, = _pgf_files(tmpdir, 1)
+    with pytest.raises(RuntimeError):
+        externalize.compile_pgf([(pgf_file, pgf_file[:-4] + '.pdf')],
+                                texsystem='pdflatex', preamble='')
+    assert latex_runs == []
+
+
+def test_compile_pgf_pages(tmpdir, latex_runs):
+    cache_dir = os.path.join(str(tmpdir), 'cache')
+    pgf_files = _pgf_files(tmpdir, 3)
+    os.remove(pgf_files[1])
+    pdf_file = os.path.join(str(tmpdir), 'batch.pdf')
+
+    assert externalize.compile_pgf_pages(pgf_files, pdf_file,
+                                         cache_dir=cache_dir,
+                                         texsystem='pdflatex', preamble='')
+    assert latex_runs == [[pgf_files[0], None, pgf_files[2]]]
+    assert _read(pdf_file).splitlines() == [pgf_files[0], 'None',
+                                            pgf_files[2]]
+
+    os.remove(pdf_file)
+    assert not externalize.compile_pgf_pages(pgf_files, pdf_file,
+                                             cache_dir=cache_dir,
+                                             texsystem='pdflatex',
+                                             preamble='')
+    assert len(latex_runs) == 1
+    assert os.path.exists(pdf_file)
+
+
+def test_manager_external_pages(tmpdir, latex_runs, monkeypatch):
+    monkeypatch.setattr(externalize, '_pdf_splitter', lambda: None)
+    pytex = MockPyTeX()
+    manager = texfigure.Manager(pytex, str(tmpdir), python_dir=False,
+                                externalize=True)
+    pgf_files = _pgf_files(manager.fig_dir, 2)
+    figures = [manager._restore_figure('fig{}'.format(i), pgf_file)
+               for i, pgf_file in enumerate(pgf_files)]
+
+    batch = os.path.join(manager.fig_dir, 'texfigure-1-0-pgf.pdf')
+    assert [fig.external_file for fig in figures] == [batch, batch]
+    assert r'\includegraphics[page=2]{{{}}}'.format(
+        batch) in figures[1].get_include()
+    assert pytex.created.count(batch) == 1
+
+    manager.flush()
+    assert latex_runs == [pgf_files]
+    assert os.path.exists(batch)
+
+    fig = manager._restore_figure('fig0', pgf_files[0])
+    assert fig.external_file.endswith('texfigure-1-1-pgf.pdf')
+    assert fig.external_page == 1
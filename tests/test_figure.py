@@ -0,0 +1,52 @@
+import pickle
+
+import texfigure
+
+
+def test_figure_defaults():
+    fig = texfigure.Figure('/tmp/my_plot.pdf', reference='my_plot')
+    assert fig.reference == 'my-plot'
+    assert fig.fname == 'my_plot.pdf'
+    assert fig.caption == 'Figure my-plot'
+    assert fig.label == 'fig:my-plot'
+    assert r'\includegraphics' in fig.repr_figure()
+
+
+def test_figure_extension_mapping_override():
+    fig = texfigure.Figure('/tmp/my_plot.jpg', reference='my_plot')
+    fig.extension_mapping['.jpg'] = fig.get_standard_include
+    assert r'\includegraphics' in fig.repr_subfigure()
+
+    other = texfigure.Figure('/tmp/other.jpg', reference='other')
+    assert '.jpg' not in other.extension_includes
+
+
+def test_figure_pickle():
+    fig = texfigure.Figure('/tmp/my_plot.pgf', reference='my_plot')
+    fig.caption = 'A plot'
+    new_fig = pickle.loads(pickle.dumps(fig, protocol=2))
+    assert new_fig.caption == 'A plot'
+    assert new_fig.repr_figure() == fig.repr_figure()
+
+
+def test_figure_external_file():
+    fig = texfigure.Figure('/tmp/my_plot.pgf', reference='my_plot')
+    assert r'\includegraphics' not in fig.get_include()
+
+    fig.external_file = '/tmp/my_plot-pgf.pdf'
+    include = fig.get_include()
+    assert r'\includegraphics{/tmp/my_plot-pgf.pdf}' in include
+    assert r'\import{/tmp/}{my_plot.pgf}' in include
+
+
+def test_figure_set_fname_base_dir():
+    fig = texfigure.Figure('/tmp/my_plot.pgf', reference='my_plot')
+    fig.fname = 'other.pgf'
+    assert fig.file_name == '/tmp/other.pgf'
+    assert fig.extension == '.pgf'
+
+    fig.base_dir = '/data/figs/'
+    assert fig.base_dir == '/data/figs/'
+    assert fig.fname == 'other.pgf'
+    assert fig.file_name == '/data/figs/other.pgf'
+    assert r'\import{/data/figs/}{other.pgf}' in fig.get_include()
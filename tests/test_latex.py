@@ -0,0 +1,159 @@
+import os
+
+import pytest
+import matplotlib
+from matplotlib.font_manager import FontProperties
+
+from texfigure import latex
+from texfigure.latex import TextMetricsCache
+
+
+def test_text_metrics_key():
+    header_hash = TextMetricsCache.header_hash('\\documentclass{article}')
+    key = TextMetricsCache.key(header_hash, '1.0', FontProperties(size=10))
+
+    assert key == TextMetricsCache.key(header_hash, '1.0',
+                                       FontProperties(size=10))
+    assert key != TextMetricsCache.key(header_hash, '1.0',
+                                       FontProperties(size=12))
+    assert key != TextMetricsCache.key(header_hash, '2.0',
+                                       FontProperties(size=10))
+    assert key != TextMetricsCache.key(TextMetricsCache.header_hash(''),
+                                       '1.0', FontProperties(size=10))
+
+
+def test_text_metrics_save(tmpdir):
+    filename = os.path.join(str(tmpdir), 'metrics.json')
+    cache = TextMetricsCache(filename)
+    assert cache.get('a') is None
+
+    cache.set('a', (10.5, 7., 2.))
+    cache.save()
+
+    cache = TextMetricsCache(filename)
+    assert len(cache) == 1
+    assert cache.get('a') == (10.5, 7., 2.)
+
+
+class MockLatexManager(object):
+    """
+    A stand-in for the pgf backend's LatexManager, which caches the manager
+    for the most recent header.
+    """
+
+    @staticmethod
+    def _build_latex_header():
+        return matplotlib.rcParams['pgf.preamble']
+
+    @classmethod
+    def _get_cached_or_new(cls):
+        return cls._get_cached_or_new_impl(cls._build_latex_header())
+
+    _cached = (None, None)
+
+    @classmethod
+    def _get_cached_or_new_impl(cls, header):
+        if cls._cached[0] != header or cls._cached[1] is None:
+            cls._cached = (header, cls())
+        return cls._cached[1]
+
+
+def test_keep_latex_managers(monkeypatch):
+    backend_pgf = pytest.importorskip('matplotlib.backends.backend_pgf')
+    monkeypatch.setattr(backend_pgf, 'LatexManager', MockLatexManager)
+    monkeypatch.setattr(latex, '_latex_managers', {})
+
+    assert latex.keep_latex_managers()
+    with matplotlib.rc_context({'pgf.preamble': 'first'}):
+        first = MockLatexManager._get_cached_or_new()
+        assert MockLatexManager._get_cached_or_new() is first
+    with matplotlib.rc_context({'pgf.preamble': 'second'}):
+        second = MockLatexManager._get_cached_or_new()
+    assert second is not first
+    with matplotlib.rc_context({'pgf.preamble': 'first'}):
+        assert MockLatexManager._get_cached_or_new() is first
+    assert len(latex._latex_managers) == 2
+
+    # Matplotlib discards the cached manager when LaTeX breaks.
+    MockLatexManager._get_cached_or_new_impl.cache_clear()
+    with matplotlib.rc_context({'pgf.preamble': 'first'}):
+        assert MockLatexManager._get_cached_or_new() is not first
+
+
+def test_format_name_tex_version(monkeypatch):
+    banners = {'pdflatex': b'pdfTeX 3.141592653-2.6-1.40.24 (TeX Live 2022)\n'}
+
+    def check_output(args, **kwargs):
+        return banners[args[0]]
+
+    monkeypatch.setattr(latex.subprocess, 'check_output', check_output)
+    monkeypatch.setattr(latex, '_tex_versions', {})
+
+    assert latex.tex_version('pdflatex').startswith('pdfTeX 3.141592653')
+    name = latex.format_name('\\documentclass{article}', 'pdflatex')
+    assert name == latex.format_name('\\documentclass{article}', 'pdflatex')
+    assert name != latex.format_name('\\documentclass{report}', 'pdflatex')
+
+    banners['pdflatex'] = b'pdfTeX 3.141592653-2.6-1.40.25 (TeX Live 2023)\n'
+    monkeypatch.setattr(latex, '_tex_versions', {})
+    assert name != latex.format_name('\\documentclass{article}', 'pdflatex')
+
+
+def test_tex_version_missing(monkeypatch):
+    monkeypatch.setattr(latex, '_tex_versions', {})
+    assert latex.tex_version('texfigure-no-such-tex') == ''
+
+
+HEADER = ('\\documentclass{article}\n\\usepackage{amsmath}\n'
+          '\\begin{document}\n\\typeout{pgf_backend_query_start}\n')
+
+
+def test_use_format(monkeypatch, tmpdir):
+    backend_pgf = pytest.importorskip('matplotlib.backends.backend_pgf')
+
+    class HeaderLatexManager(object):
+        @staticmethod
+        def _build_latex_header():
+            return HEADER
+
+    built = []
+    names = {}
+
+    def build_format(preamble, texsystem, fmt_dir):
+        built.append((preamble, texsystem, fmt_dir))
+        return names.get(texsystem)
+
+    monkeypatch.setattr(backend_pgf, 'LatexManager', HeaderLatexManager)
+    monkeypatch.setattr(latex, 'build_format', build_format)
+    monkeypatch.setattr(latex, '_format_dir', None)
+    monkeypatch.setattr(latex, '_formats', {})
+    monkeypatch.setenv('TEXFORMATS', '/other/formats')
+
+    fmt_dir = os.path.join(str(tmpdir), 'formats')
+    latex.use_format(fmt_dir)
+    latex.use_format(fmt_dir)
+    assert os.path.isdir(fmt_dir)
+    assert os.environ['TEXFORMATS'] == os.pathsep.join([fmt_dir,
+                                                        '/other/formats'])
+
+    names['pdflatex'] = 'texfigure-0123456789abcdef'
+    with matplotlib.rc_context({'pgf.texsystem': 'pdflatex'}):
+        header = HeaderLatexManager._build_latex_header()
+        assert header.startswith('&texfigure-0123456789abcdef\n')
+        assert header.endswith('\n\\begin{document}\n'
+                               '\\typeout{pgf_backend_query_start}\n')
+        assert '\\usepackage' not in header
+        # The format for each preamble is only built once.
+        assert HeaderLatexManager._build_latex_header() == header
+    assert built == [(HEADER.partition('\\begin{document}')[0], 'pdflatex',
+                      fmt_dir)]
+
+    # The preamble is kept if the format can not be built.
+    with matplotlib.rc_context({'pgf.texsystem': 'lualatex'}):
+        assert HeaderLatexManager._build_latex_header() == HEADER
+    assert HeaderLatexManager._texfigure_build_header() == HEADER
+
+    # A trailing separator keeps the default search path.
+    monkeypatch.delenv('TEXFORMATS')
+    latex.use_format(fmt_dir)
+    assert os.environ['TEXFORMATS'] == fmt_dir + os.pathsep
@@ -0,0 +1,246 @@
+import os
+import re
+import gc
+import shutil
+import weakref
+
+import pytest
+import numpy as np
+import matplotlib.pyplot as plt
+
+import texfigure
+from texfigure import texfigure as core
+
+
+class MockPyTeX(object):
+
+    def __init__(self):
+        self.dependencies = []
+        self.created = []
+
+    def add_dependencies(self, *files):
+        self.dependencies.extend(files)
+
+    def add_created(self, *files):
+        self.created.extend(files)
+
+
+def _manager(tmpdir, **kwargs):
+    return texfigure.Manager(MockPyTeX(), str(tmpdir), python_dir=False,
+                             **kwargs)
+
+
+def _save(manager, *refs):
+    fig = plt.figure()
+    for ref in refs:
+        manager.save_figure(ref, fig, fext='.png')
+    plt.close(fig)
+
+
+def _macro_numbers(filename):
+    with open(filename) as fobj:
+        return [(ref, int(number)) for ref, number in re.findall(
+            r'texfigure@number@([^\\]+)\\endcsname\{(\d+)\}', fobj.read())]
+
+
+def test_figure_macros_only_this_session(tmpdir):
+    first = _manager(tmpdir, cache_dir=True)
+    _save(first, 'old1', 'old2', 'old3')
+    first.flush()
+
+    second = _manager(tmpdir, cache_dir=True)
+    _save(second, 'new', 'old3')
+
+    refs = [ref for ref, _ in _macro_numbers(second.write_figure_macros())]
+    assert refs == ['new', 'old3']
+    assert 'old1' in second._figure_registry
+
+
+def test_figure_numbers(tmpdir):
+    manager = _manager(tmpdir)
+    _save(manager, 'a', 'a')
+    assert _macro_numbers(manager.write_figure_macros()) == [('a', 1)]
+
+    _save(manager, 'b', 'a', 'c')
+    assert _macro_numbers(manager.write_figure_macros()) == [('a', 1),
+                                                             ('b', 2),
+                                                             ('c', 3)]
+
+
+def test_figure_numbers_between_sessions(tmpdir):
+    first = _manager(tmpdir, cache_dir=True)
+    _save(first, 'old1', 'old2', 'old3')
+    first.flush()
+
+    second = _manager(tmpdir, cache_dir=True)
+    _save(second, 'new', 'old3')
+    assert _macro_numbers(second.write_figure_macros()) == [('new', 1),
+                                                            ('old3', 2)]
+
+
+def test_manager_not_kept_alive(tmpdir):
+    manager = _manager(tmpdir)
+    ref = weakref.ref(manager)
+    del manager
+    gc.collect()
+    assert ref() is None
+
+
+def test_session_end_without_directory(tmpdir):
+    base = tmpdir.mkdir('chapter')
+    manager = _manager(base)
+    _save(manager, 'a')
+    shutil.rmtree(str(base))
+    manager._session_end()
+
+    manager = _manager(tmpdir)
+    _save(manager, 'a')
+    manager._session_end()
+    assert os.path.exists(os.path.join(str(tmpdir), 'texfigure-report-1.json'))
+
+
+def test_build_report(tmpdir):
+    manager = _manager(tmpdir)
+    small_png, big_png, big_pdf = [os.path.join(manager.fig_dir, name) for name
+                                   in ('small.png', 'big.png', 'big.pdf')]
+    manager._build_report.add_save('small', small_png, 0.1)
+    manager._build_report.add_save('big', big_png, 0.5)
+    manager._build_report.add_save('big', big_pdf, 0.2)
+    manager._build_report.add_figure_time('small', 0.05)
+    for filename, size in ((small_png, 10), (big_png, 100)):
+        with open(filename, 'wb') as fobj:
+            fobj.write(b'x' * size)
+
+    report = manager.build_report()
+    assert [record['ref'] for record in report] == ['big', 'small']
+
+    big, small = report
+    assert [entry['format'] for entry in big['files']] == ['png', 'pdf']
+    assert [entry['size'] for entry in big['files']] == [100, None]
+    assert big['size'] == 100
+    assert big['save_time'] == pytest.approx(0.7)
+    assert big['total_time'] == pytest.approx(0.7)
+    assert small['size'] == 10
+    assert small['total_time'] == pytest.approx(0.15)
+
+
+class BasePlot(object):
+    pass
+
+
+class SubPlot(BasePlot):
+    pass
+
+
+def _save_base(fig, filename, **kwargs):
+    return filename
+
+
+def _save_sub(fig, filename, **kwargs):
+    return filename
+
+
+def test_save_function_mro(tmpdir):
+    manager = _manager(tmpdir)
+    manager.register_save_function(BasePlot, _save_base)
+    assert manager.get_save_function(SubPlot()) is _save_base
+
+    manager.register_save_function(SubPlot, _save_sub)
+    assert manager.get_save_function(SubPlot()) is _save_sub
+    assert manager.get_save_function(BasePlot()) is _save_base
+
+    with pytest.raises(TypeError):
+        manager.get_save_function(object())
+
+
+def test_save_function_type_name(tmpdir):
+    manager = _manager(tmpdir)
+    manager.register_save_function(
+        '{}.BasePlot'.format(BasePlot.__module__), _save_base)
+    assert manager.get_save_function(SubPlot()) is _save_base
+
+    manager.register_save_function(SubPlot, _save_sub)
+    assert manager.get_save_function(SubPlot()) is _save_sub
+
+
+class MockEntryPoint(object):
+
+    def __init__(self, name, function):
+        self.name = name
+        self.function = function
+
+    def load(self):
+        return self.function
+
+
+def test_save_function_entry_points(tmpdir, monkeypatch):
+    module = BasePlot.__module__
+    monkeypatch.setattr(core, '_entry_point_savers', None)
+    monkeypatch.setattr(core, '_iter_entry_points', lambda group: [
+        MockEntryPoint(module + '.BasePlot', _save_base),
+        MockEntryPoint(module + '.SubPlot', _save_sub)])
+
+    manager = _manager(tmpdir)
+    assert manager.get_save_function(SubPlot()) is _save_sub
+    assert manager.get_save_function(BasePlot()) is _save_base
+    assert manager.savefigure_functions[module + '.SubPlot'] is _save_sub
+
+
+def test_iter_entry_points():
+    assert core._iter_entry_points('texfigure.no-such-group') == []
+
+
+def test_load_data(tmpdir):
+    data_dir = tmpdir.mkdir('Data')
+    np.save(str(data_dir.join('values.npy')), np.arange(10.))
+    np.savez(str(data_dir.join('archive.npz')), values=np.arange(5.))
+    manager = _manager(tmpdir)
+
+    values = manager.load_data('values.npy')
+    assert manager.load_data('values.npy') is values
+    assert np.all(values == np.arange(10.))
+    assert not values.flags.writeable
+    with pytest.raises(ValueError):
+        values[0] = 1
+
+    assert manager.load_data('values.npy', mmap=False) is not values
+    assert manager.load_data('values.npy', mmap=False).flags.writeable
+
+    # Closing one archive does not affect the next load of the file.
+    archive = manager.load_data('archive.npz')
+    archive.close()
+    assert np.all(manager.load_data('archive.npz')['values'] == np.arange(5.))
+
+    paths = [os.path.join(str(data_dir), name)
+             for name in ('values.npy', 'archive.npz')]
+    assert set(manager.pytex.dependencies) == set(paths)
+
+
+def test_save_figure_several_extensions(tmpdir):
+    manager = _manager(tmpdir)
+    fig = plt.figure()
+    Fig = manager.save_figure('several', fig, fname='custom.pdf',
+                              fext=['.pdf', '.png'])
+    plt.close(fig)
+
+    fnames = [os.path.join(manager.fig_dir, name)
+              for name in ('custom.pdf', 'custom.png')]
+    assert Fig.file_name == fnames[0]
+    for fname in fnames:
+        assert os.path.exists(fname)
+        assert fname in manager.pytex.created
+
+
+def test_exit_flushes_without_processes(tmpdir):
+    manager = _manager(tmpdir)
+    flushed = []
+    manager.flush = lambda: flushed.append(True)
+
+    with manager:
+        pass
+    assert flushed == [True]
+
+    with pytest.raises(KeyError):
+        with manager:
+            raise KeyError()
+    assert flushed == [True]
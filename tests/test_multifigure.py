@@ -1,5 +1,87 @@
+import pytest
+
 import texfigure
 
 def test_init_multifigure():
     mf = texfigure.MultiFigure()
     assert isinstance(mf, texfigure.MultiFigure)
+
+
+def _figures(n):
+    return [texfigure.Figure('fig{}.pdf'.format(i), reference='fig{}'.format(i))
+            for i in range(n)]
+
+
+def test_multifigure_len():
+    mf = texfigure.MultiFigure(2, 3)
+    assert len(mf) == 6
+
+
+def test_multifigure_append():
+    mf = texfigure.MultiFigure(2, 2)
+    figures = _figures(4)
+    for fig in figures:
+        mf.append(fig)
+    assert list(mf.figures.flat) == figures
+
+    with pytest.raises(ValueError):
+        mf.append(_figures(1)[0])
+
+
+def test_multifigure_append_fills_gaps():
+    mf = texfigure.MultiFigure(1, 3)
+    first, second, third = _figures(3)
+    mf.figures[0, 1] = second
+    mf.append(first)
+    mf.append(third)
+    assert list(mf.figures.flat) == [first, second, third]
+
+
+def test_multifigure_extend():
+    mf = texfigure.MultiFigure(2, 2)
+    figures = _figures(4)
+    mf.append(figures[0])
+    mf.extend(figures[1:])
+    assert list(mf.figures.flat) == figures
+
+    mf = texfigure.MultiFigure(1, 2)
+    with pytest.raises(ValueError):
+        mf.extend(_figures(3))
+    assert all(fig is None for fig in mf.figures.flat)
+
+    with pytest.raises(TypeError):
+        mf.extend(['not a figure'])
+
+
+def test_multifigure_extend_cursor():
+    mf = texfigure.MultiFigure(2, 3)
+    first, second, third, fourth = _figures(4)
+    mf.figures[0, 1] = second
+    mf.extend([first])
+    assert mf._cursor == 1
+
+    mf.extend([third, fourth])
+    assert mf._cursor == 4
+    assert list(mf.figures.flat)[:4] == [first, second, third, fourth]
+
+    mf.extend([])
+    assert mf._cursor == 4
+
+
+def test_multifigure_split():
+    mf = texfigure.MultiFigure(5, 2, reference='grid')
+    mf.extend(_figures(10))
+    mf.caption = 'A big grid'
+
+    chunks = list(mf.split(2))
+    assert [chunk.nrows for chunk in chunks] == [2, 2, 1]
+    assert [chunk.caption for chunk in chunks] == ['', '', 'A big grid']
+    assert [chunk.label for chunk in chunks] == ['fig:grid', 'fig:grid-c1',
+                                                 'fig:grid-c2']
+    assert r'\ContinuedFloat' not in chunks[0].frontmatter
+    assert all(r'\ContinuedFloat' in chunk.frontmatter for chunk in chunks[1:])
+    assert sum(chunk.figures.size for chunk in chunks) == 10
+
+    latex = list(mf.iter_latex(2))
+    assert len(latex) == 3
+    assert latex[1].count(r'\begin{subfigure}') == 4
@@ -0,0 +1,34 @@
+import os
+
+from texfigure.output import strip_volatile, replace_if_changed
+
+
+def _write(filename, data):
+    with open(filename, 'wb') as fobj:
+        fobj.write(data)
+
+
+def test_strip_volatile_pdf():
+    first = b"<< /CreationDate (D:20170101120000Z) /Creator (matplotlib) >>"
+    second = b"<< /CreationDate (D:20180101120000Z) /Creator (matplotlib) >>"
+    assert strip_volatile(first, '.pdf') == strip_volatile(second, '.pdf')
+    assert strip_volatile(first, '.png') == first
+
+
+def test_replace_if_changed(tmpdir):
+    dst = os.path.join(str(tmpdir), 'figure.pdf')
+    src = os.path.join(str(tmpdir), 'new.pdf')
+
+    _write(dst, b"%PDF /CreationDate (D:20170101120000Z) content")
+    os.utime(dst, (0, 0))
+
+    _write(src, b"%PDF /CreationDate (D:20180101120000Z) content")
+    assert not replace_if_changed(src, dst)
+    assert not os.path.exists(src)
+    assert os.path.getmtime(dst) == 0
+
+    _write(src, b"%PDF /CreationDate (D:20180101120000Z) changed")
+    assert replace_if_changed(src, dst)
+    assert not os.path.exists(src)
+    with open(dst, 'rb') as fobj:
+        assert fobj.read().endswith(b"changed")
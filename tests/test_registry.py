@@ -0,0 +1,90 @@
+import os
+
+import pytest
+
+import texfigure
+from texfigure.registry import FigureRegistry
+
+
+def _entry(ref, number):
+    return {'number': number,
+            'Figure': texfigure.Figure('/tmp/{}.pdf'.format(ref),
+                                       reference=ref)}
+
+
+def _registry(tmpdir, manager_number=1):
+    return FigureRegistry(os.path.join(str(tmpdir), 'registry.sqlite'),
+                          manager_number=manager_number)
+
+
+def test_registry_in_memory():
+    registry = FigureRegistry()
+    registry['a'] = _entry('a', 1)
+    assert 'a' in registry
+    assert list(registry) == ['a']
+    assert registry['a']['Figure'].reference == 'a'
+
+    del registry['a']
+    assert 'a' not in registry
+    with pytest.raises(KeyError):
+        del registry['a']
+
+
+def test_registry_persistence(tmpdir):
+    registry = _registry(tmpdir)
+    registry['a'] = _entry('a', 1)
+    registry['b'] = _entry('b', 2)
+    _registry(tmpdir, manager_number=2)['a'] = _entry('other', 1)
+    registry.close()
+
+    registry = _registry(tmpdir)
+    assert registry.session_items() == []
+    assert len(registry) == 2
+    assert list(registry) == ['a', 'b']
+    assert registry['b']['number'] == 2
+    assert registry['a']['Figure'].file_name == '/tmp/a.pdf'
+    assert 'c' not in registry
+    with pytest.raises(KeyError):
+        registry['c']
+
+    registry['c'] = _entry('c', 1)
+    assert list(registry) == ['c', 'a', 'b']
+    assert [ref for ref, _ in registry.session_items()] == ['c']
+    registry.close()
+
+    assert _registry(tmpdir, manager_number=2)['a']['Figure'].reference == \
+        'other'
+
+
+def test_registry_sync(tmpdir):
+    registry = _registry(tmpdir)
+    registry['a'] = _entry('a', 1)
+    registry['a']['Figure'].caption = 'A new caption'
+    assert _registry(tmpdir)['a']['Figure'].caption == 'Figure a'
+
+    registry.sync()
+    assert _registry(tmpdir)['a']['Figure'].caption == 'A new caption'
+    registry.close()
+
+
+def test_registry_delete(tmpdir):
+    registry = _registry(tmpdir)
+    registry['a'] = _entry('a', 1)
+    registry['b'] = _entry('b', 2)
+    registry.close()
+
+    registry = _registry(tmpdir)
+    registry['a']
+    del registry['a']
+    assert 'a' not in registry
+    assert list(registry) == ['b']
+
+    registry['c'] = _entry('c', 1)
+    del registry['c']
+    del registry['b']
+    assert len(registry) == 0
+    with pytest.raises(KeyError):
+        del registry['b']
+    registry.close()
+
+    assert len(_registry(tmpdir)) == 0
@@ -0,0 +1,138 @@
+import os
+import pickle
+
+import pytest
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_pgf import FigureCanvasPgf
+
+from texfigure import render
+
+
+@pytest.mark.parametrize('savefig_backend', [True, False])
+def test_save_raster_with_agg(tmpdir, monkeypatch, savefig_backend):
+    monkeypatch.setattr(render, '_SAVEFIG_BACKEND', savefig_backend)
+
+    fig = Figure()
+    canvas = FigureCanvasPgf(fig)
+    fig.add_subplot(111).plot([1, 2, 3])
+
+    filename = os.path.join(str(tmpdir), 'plot.png')
+    render.save_mpl_figure(fig, filename, backends=render.RASTER_BACKENDS)
+
+    with open(filename, 'rb') as fobj:
+        assert fobj.read(8) == b'\x89PNG\r\n\x1a\n'
+    assert fig.canvas is canvas
+
+
+@pytest.mark.parametrize('fext', ['.pdf', '.svg'])
+def test_save_deterministic(tmpdir, fext):
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    fig.add_subplot(111).plot([1, 2, 3])
+
+    contents = []
+    for name in ('first', 'second'):
+        filename = os.path.join(str(tmpdir), name + fext)
+        render.save_mpl_figure(fig, filename, deterministic=True)
+        with open(filename, 'rb') as fobj:
+            contents.append(fobj.read())
+
+    assert contents[0] == contents[1]
+
+
+def test_render_pickled_closes_figure(tmpdir):
+    fig = plt.figure()
+    fig.add_subplot(111).plot([1, 2, 3])
+    data = pickle.dumps(fig)
+    plt.close(fig)
+
+    fignums = plt.get_fignums()
+    filename = os.path.join(str(tmpdir), 'plot.png')
+    options = {'backends': render.RASTER_BACKENDS}
+    saved, seconds = render._render_pickled(render.save_mpl_figure, data,
+                                            filename, options, {})
+    assert saved == filename
+    assert seconds >= 0
+    assert plt.get_fignums() == fignums
+
+    with pytest.raises(ValueError):
+        render._render_pickled(render.save_mpl_figure, data,
+                               filename[:-4] + '.nosuchformat', options, {})
+    assert plt.get_fignums() == fignums
+
+
+def test_render_queue_flush(tmpdir):
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    fig.add_subplot(111).plot([1, 2, 3])
+    data = pickle.dumps(fig)
+
+    done = []
+    queue = render.RenderQueue(processes=1)
+    try:
+        filename = os.path.join(str(tmpdir), 'plot.png')
+        queue.submit(render.save_mpl_figure, data, filename, {},
+                     on_done=lambda saved, seconds: done.append(saved))
+        assert len(queue) == 1
+        queue.flush()
+        assert len(queue) == 0
+        assert done == [filename]
+        assert os.path.exists(filename)
+
+        for name in ('bad1.nosuchformat', 'good.png', 'bad2.nosuchformat'):
+            queue.submit(render.save_mpl_figure, data,
+                         os.path.join(str(tmpdir), name), {},
+                         on_done=lambda saved, seconds: done.append(saved))
+        with pytest.raises(RuntimeError) as err:
+            queue.flush()
+        assert '2 figure(s) failed' in str(err.value)
+        assert 'bad1.nosuchformat' in str(err.value)
+        assert 'bad2.nosuchformat' in str(err.value)
+        assert done[-1] == os.path.join(str(tmpdir), 'good.png')
+        assert os.path.exists(done[-1])
+        assert len(queue) == 0
+    finally:
+        queue.shutdown()
+
+
+def test_count_vertices():
+    fig = Figure()
+    ax = fig.add_subplot(111)
+    line, = ax.plot(np.arange(50))
+    scatter = ax.scatter(np.arange(100), np.arange(100))
+    text = ax.text(0, 0, 'label')
+
+    assert render.count_vertices(line) == 50
+    assert render.count_vertices(scatter) == 100
+    assert render.count_vertices(text) == 0
+
+
+def test_rasterize_dense_artists(tmpdir):
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    ax.grid(True)
+    scatter = ax.scatter(np.random.rand(1000), np.random.rand(1000))
+    line, = ax.plot([0, 1], [0, 1])
+    text = ax.set_title('title')
+    vector = [line, text] + ax.get_xgridlines() + ax.get_ygridlines()
+
+    rasterized = []
+    fig.canvas.mpl_connect('draw_event', lambda event: rasterized.append(
+        [scatter.get_rasterized()] +
+        [artist.get_rasterized() for artist in vector]))
+
+    filename = os.path.join(str(tmpdir), 'plot.svg')
+    render.save_mpl_figure(fig, filename, rasterize_threshold=100)
+    assert rasterized == [[True] + [False] * len(vector)]
+    assert not scatter.get_rasterized()
+    with open(filename) as fobj:
+        assert '<image' in fobj.read()
+
+    # Raster formats are saved unchanged.
+    render.save_mpl_figure(fig, os.path.join(str(tmpdir), 'plot.png'),
+                           rasterize_threshold=100)
+    assert rasterized[-1][0] is False
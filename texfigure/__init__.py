@@ -15,8 +15,8 @@ from ._astropy_init import *
 
 # For egg_info test builds to pass, put package imports here.
 if not _ASTROPY_SETUP_:
-    from setup_mpl import configure_latex_plots, figsize # This sets pgf backend
-    from texfigure import *
+    from .setup_mpl import configure_latex_plots, figsize # This sets pgf backend
+    from .texfigure import *
 
 import sys
 
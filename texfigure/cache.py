@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+A content addressed cache of rendered figure files.
+"""
+from __future__ import print_function
+import os
+import json
+import shutil
+import pickle
+import hashlib
+import tempfile
+
+try:
+    import copyreg
+except ImportError:
+    import copy_reg as copyreg
+
+import matplotlib
+import matplotlib.figure
+from matplotlib.transforms import AffineBase, BboxBase, TransformedPath
+
+from .output import companion_files, copy_if_changed
+
+__all__ = ['RenderCache', 'figure_fingerprint', 'pickle_figure']
+
+# Instance attributes which change with object ids, drawing or the pyplot
+# figure number, rather than with the content of a figure, and are left out
+# of fingerprints.
+VOLATILE_ATTRIBUTES = frozenset(['_parents', '_invalid', 'stale', '_stale',
+                                 '_cid_gen', '_number', '_restore_to_pylab'])
+
+
+def _reduce_stable(obj):
+    # Transforms and bounding boxes computed from other transforms cache
+    # their value when it is first used, e.g. while saving a figure.
+    # Compute them so their state does not depend on which were used.
+    if isinstance(obj, BboxBase):
+        obj.get_points()
+    elif isinstance(obj, AffineBase):
+        obj.get_matrix()
+    elif isinstance(obj, TransformedPath):
+        obj.get_fully_transformed_path()
+
+    reduced = obj.__reduce_ex__(2)
+    if (isinstance(reduced, tuple) and len(reduced) > 2 and
+            isinstance(reduced[2], dict)):
+        state = dict((key, value) for key, value in reduced[2].items()
+                     if key not in VOLATILE_ATTRIBUTES)
+        reduced = reduced[:2] + (state,) + reduced[3:]
+    return reduced
+
+
+class _StableDispatch(object):
+    """
+    A pickler dispatch table which drops the volatile attributes from the
+    state of every object.
+    """
+
+    def __getitem__(self, atype):
+        if issubclass(atype, type):
+            raise KeyError(atype)
+        try:
+            return copyreg.dispatch_table[atype]
+        except KeyError:
+            return _reduce_stable
+
+
+class _HashWriter(object):
+    """
+    A write-only file which feeds everything written to it into a hash, so
+    an object can be pickled into a hash without holding the pickle.
+    """
+
+    def __init__(self):
+        self.sha = hashlib.sha1()
+
+    def write(self, data):
+        self.sha.update(data)
+
+
+def pickle_figure(fig):
+    """
+    Return the pickled figure object, or `None` if it can not be pickled.
+    """
+    try:
+        return pickle.dumps(fig, protocol=2)
+    except Exception:
+        return None
+
+
+def _draw_without_rendering(fig):
+    """
+    Draw a matplotlib figure with the Agg backend without rendering
+    anything, leaving the figure's own canvas in place.
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    canvas = fig.canvas
+    FigureCanvasAgg(fig)
+    try:
+        if hasattr(fig, 'draw_without_rendering'):
+            fig.draw_without_rendering()
+        else:
+            fig.canvas.draw()
+    finally:
+        fig.set_canvas(canvas)
+
+
+def figure_fingerprint(fig):
+    """
+    Return a `bytes` fingerprint of the state of a figure object.
+
+    The fingerprint is the SHA1 digest of the figure pickled without the
+    attributes in ``VOLATILE_ATTRIBUTES``, which for matplotlib covers the
+    whole artist tree including the data arrays, and is the same for the
+    same figure made in different sessions. The pickle is hashed as it is
+    written rather than held in memory. Figures which can not be pickled
+    return `None` and are never cached.
+
+    Drawing a matplotlib figure fills in state derived from its content,
+    such as tick locations and transforms, so matplotlib figures are drawn
+    without rendering before they are pickled, and the fingerprint is the
+    same whether or not the figure has been drawn or saved before.
+    """
+    if isinstance(fig, matplotlib.figure.Figure):
+        try:
+            _draw_without_rendering(fig)
+        except Exception:
+            return None
+
+    writer = _HashWriter()
+    pickler = pickle.Pickler(writer, 2)
+    pickler.dispatch_table = _StableDispatch()
+    try:
+        pickler.dump(fig)
+    except Exception:
+        return None
+    return writer.sha.digest()
+
+
+class RenderCache(object):
+    """
+    A persistent store of rendered figures keyed by a hash of the figure.
+
+    Each entry is a directory named by the key, containing the saved figure
+    file and any companion files the save produced, along with a manifest
+    listing them.
+
+    Parameters
+    ----------
+
+    cache_dir : `str`
+        The directory in which to store cache entries.
+    """
+
+    manifest_name = 'files.json'
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def key(self, fingerprint, filename, kwargs, extra=None):
+        """
+        Compute the cache key for saving a figure to ``filename``.
+
+        Parameters
+        ----------
+
+        fingerprint : `bytes`
+            The digest of the figure object to be saved, as returned by
+            `~texfigure.cache.figure_fingerprint`.
+
+        filename : `str`
+            The filename the figure is to be saved to. Only the base name
+            contributes to the key, as it is embedded in some outputs.
+
+        kwargs : `dict`
+            The keyword arguments passed to the save function.
+
+        extra : `dict`
+            Any other options which change the rendered output.
+
+        Returns
+        -------
+
+        key : `str`
+            The hex digest key.
+        """
+        sha = hashlib.sha1()
+        sha.update(fingerprint)
+        for part in (os.path.basename(filename),
+                     sorted(kwargs.items()),
+                     sorted((extra or {}).items()),
+                     sorted(matplotlib.rcParams.items()),
+                     matplotlib.__version__):
+            sha.update(repr(part).encode('utf-8'))
+
+        return sha.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def fetch(self, key, filename):
+        """
+        Copy the cached files for ``key`` into the directory of ``filename``.
+
+        Existing files with the same content are left untouched.
+
+        Returns
+        -------
+
+        filename : `str` or `None`
+            The full path of the restored figure file, or `None` if there is
+            no entry for ``key``.
+        """
+        entry = self._entry(key)
+        try:
+            with open(os.path.join(entry, self.manifest_name)) as fobj:
+                names = json.load(fobj)
+        except (IOError, OSError, ValueError):
+            return None
+
+        out_dir = os.path.dirname(filename)
+        for name in names:
+            copy_if_changed(os.path.join(entry, name),
+                            os.path.join(out_dir, name))
+
+        return os.path.join(out_dir, names[0])
+
+    def store(self, key, filename):
+        """
+        Add the saved file ``filename`` and its companions to the cache.
+        """
+        entry = self._entry(key)
+        if os.path.exists(entry):
+            return
+
+        files = [filename] + companion_files(filename)
+        tmp_entry = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp-')
+        try:
+            for afile in files:
+                shutil.copyfile(afile, os.path.join(tmp_entry,
+                                                    os.path.basename(afile)))
+            with open(os.path.join(tmp_entry, self.manifest_name), 'w') as fobj:
+                json.dump([os.path.basename(afile) for afile in files], fobj)
+            os.rename(tmp_entry, entry)
+        except OSError:
+            # Another process stored the same entry first.
+            shutil.rmtree(tmp_entry, ignore_errors=True)
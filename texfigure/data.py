@@ -0,0 +1,483 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers for finding and reading the data files used to make figures.
+"""
+from __future__ import print_function
+import os
+import glob
+import fnmatch
+import itertools
+
+import numpy as np
+
+__all__ = ['DirectoryIndex', 'load_data', 'iter_chunks', 'StreamingHistogram',
+           'StreamingHistogram2D', 'StreamingBinnedStatistic']
+
+FITS_EXTENSIONS = ('.fits', '.fit', '.fts')
+HDF5_EXTENSIONS = ('.h5', '.hdf5', '.hdf', '.he5')
+TEXT_EXTENSIONS = ('.csv', '.txt', '.dat')
+
+# The memory mapped ``.npy`` arrays opened in this session, keyed by the path
+# and the modification time and size of the file.
+_mapped_files = {}
+
+
+class DirectoryIndex(object):
+    """
+    An in-memory index of the files in a directory tree.
+
+    The listing of each directory is read once and reused until the
+    modification time of the directory changes, so repeatedly looking up
+    names or glob patterns does not rescan large directories.
+
+    Parameters
+    ----------
+
+    root : `str`
+        The directory to index.
+
+    Notes
+    -----
+
+    Some filesystems only record directory modification times to the
+    nearest second, call `~texfigure.data.DirectoryIndex.refresh` if files
+    may have been added since the last lookup in the same second.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._listings = {}
+
+    def refresh(self):
+        """
+        Forget all the cached directory listings.
+        """
+        self._listings.clear()
+
+    def listdir(self, dirname):
+        """
+        Return the sorted names in ``dirname``, relative to the root.
+        """
+        path = os.path.join(self.root, dirname)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self._listings.pop(path, None)
+            return [], frozenset()
+
+        signature = (stat.st_mtime, stat.st_size)
+        cached = self._listings.get(path)
+        if cached is None or cached[0] != signature:
+            names = sorted(os.listdir(path))
+            cached = (signature, names, frozenset(names))
+            self._listings[path] = cached
+
+        return cached[1], cached[2]
+
+    def find(self, pattern):
+        """
+        Return the full paths of the files matching a name or glob pattern.
+
+        Parameters
+        ----------
+
+        pattern : `str`
+            A file name or glob pattern relative to the root. Patterns with
+            wildcards in the directory part fall back to `glob.glob`.
+
+        Returns
+        -------
+
+        paths : `list`
+            The sorted matching paths.
+        """
+        dirname, basename = os.path.split(pattern)
+        if not basename or glob.has_magic(dirname):
+            return sorted(glob.glob(os.path.join(self.root, pattern)))
+
+        names, name_set = self.listdir(dirname)
+
+        if not glob.has_magic(basename):
+            matches = [basename] if basename in name_set else []
+        else:
+            matches = fnmatch.filter(names, basename)
+            if not basename.startswith('.'):
+                matches = [name for name in matches
+                           if not name.startswith('.')]
+
+        return [os.path.join(self.root, dirname, name) for name in matches]
+
+
+def load_data(path, mmap=True):
+    """
+    Load the data in a ``.npy``, ``.npz`` or FITS file.
+
+    When ``mmap`` is `True` the data are memory mapped rather than read, so
+    only the parts of the file which are used are read from disk. A memory
+    mapped ``.npy`` file is only opened once per session, later calls for
+    the same (unchanged) file return the same read-only array.
+
+    ``.npz`` archives and FITS files are opened anew by every call, so the
+    caller can close them. The members of a ``.npz`` archive are read when
+    they are accessed, they can not be memory mapped. FITS files are memory
+    mapped by astropy when ``mmap`` is `True`.
+
+    Parameters
+    ----------
+
+    path : `str`
+        The full path of the file.
+
+    mmap : `bool`
+        Memory map the file.
+
+    Returns
+    -------
+
+    data : `numpy.ndarray`, `numpy.lib.npyio.NpzFile` or `astropy.io.fits.HDUList`
+        The read-only memory mapped array for ``.npy`` files, the lazily
+        loading archive for ``.npz`` files and the list of HDUs for FITS
+        files.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in ('.npy', '.npz') + FITS_EXTENSIONS:
+        raise ValueError("Can not load data from files with the extension "
+                         "{}".format(ext))
+
+    key = None
+    if mmap and ext == '.npy':
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_mtime, stat.st_size)
+        if key in _mapped_files:
+            return _mapped_files[key]
+
+    if ext in FITS_EXTENSIONS:
+        from astropy.io import fits
+        data = fits.open(path, memmap=mmap)
+    elif ext == '.npz':
+        data = np.load(path)
+    else:
+        data = np.load(path, mmap_mode='r' if mmap else None)
+
+    if key is not None:
+        _mapped_files[key] = data
+
+    return data
+
+
+def iter_chunks(path, chunk_size=1000000, columns=None, dataset=None,
+                delimiter=None, skiprows=0):
+    """
+    Read a large data file in chunks of rows, so it can be reduced without
+    loading it all into memory.
+
+    Parameters
+    ----------
+
+    path : `str`
+        The full path of a ``.npy``, HDF5 (``.h5``, ``.hdf5``) or text
+        (``.csv``, ``.txt``, ``.dat``) file.
+
+    chunk_size : `int`
+        The number of rows in each chunk.
+
+    columns : `int` or `list`
+        Only return these columns of two dimensional data.
+
+    dataset : `str`
+        The name of the dataset in an HDF5 file, which can be omitted if the
+        file only contains one dataset. Reading HDF5 files requires h5py.
+
+    delimiter : `str`
+        The column separator in text files, defaults to ``,`` for ``.csv``
+        files and whitespace otherwise.
+
+    skiprows : `int`
+        The number of header lines to skip in text files.
+
+    Yields
+    ------
+
+    chunk : `numpy.ndarray`
+        The next ``chunk_size`` rows of the file. Text files are always read
+        as two dimensional floating point arrays.
+    """
+    ext = os.path.splitext(path)[1].lower()
+
+    if ext == '.npy':
+        data = load_data(path, mmap=True)
+        for start in range(0, len(data), chunk_size):
+            chunk = data[start:start + chunk_size]
+            yield chunk if columns is None else chunk[:, columns]
+
+    elif ext in HDF5_EXTENSIONS:
+        import h5py
+        with h5py.File(path, 'r') as hdf:
+            if dataset is None:
+                names = list(hdf.keys())
+                if len(names) != 1:
+                    raise ValueError("{} contains {} datasets, specify which "
+                                     "to read.".format(path, len(names)))
+                dataset = names[0]
+            data = hdf[dataset]
+            for start in range(0, len(data), chunk_size):
+                chunk = data[start:start + chunk_size]
+                yield chunk if columns is None else chunk[:, columns]
+
+    elif ext in TEXT_EXTENSIONS:
+        if delimiter is None and ext == '.csv':
+            delimiter = ','
+        if isinstance(columns, int):
+            columns = [columns]
+        with open(path) as fobj:
+            lines = itertools.islice(fobj, skiprows, None)
+            while True:
+                chunk = list(itertools.islice(lines, chunk_size))
+                if not chunk:
+                    break
+                yield np.loadtxt(chunk, delimiter=delimiter, usecols=columns,
+                                 ndmin=2)
+
+    else:
+        raise ValueError("Can not read chunks from files with the extension "
+                         "{}".format(ext))
+
+
+def _bin_edges(bins, range=None):
+    """
+    Return the bin edges for a number of bins over a range, or the given
+    edges.
+    """
+    if np.ndim(bins) == 0:
+        if range is None:
+            raise ValueError("A range must be given with a number of bins, "
+                             "as the data are not all available at once.")
+        return np.linspace(range[0], range[1], int(bins) + 1)
+    return np.asarray(bins, dtype=float)
+
+
+class StreamingHistogram(object):
+    """
+    A one dimensional histogram accumulated over chunks of data.
+
+    Parameters
+    ----------
+
+    bins : `int` or array
+        The number of bins, or the bin edges.
+
+    range : `tuple`
+        The ``(lower, upper)`` range of the bins, required if ``bins`` is a
+        number.
+
+    Attributes
+    ----------
+
+    counts : `numpy.ndarray`
+        The (weighted) number of values in each bin so far.
+
+    edges : `numpy.ndarray`
+        The bin edges.
+    """
+
+    def __init__(self, bins, range=None):
+        self.edges = _bin_edges(bins, range)
+        self.counts = np.zeros(len(self.edges) - 1)
+
+    def add(self, values, weights=None):
+        """
+        Add a chunk of values, with optional weights, to the histogram.
+        """
+        self.counts += np.histogram(values, self.edges, weights=weights)[0]
+
+
+class StreamingHistogram2D(object):
+    """
+    A two dimensional histogram accumulated over chunks of data.
+
+    Parameters
+    ----------
+
+    bins : `int`, array or `tuple`
+        The number of bins or the bin edges, for both dimensions or as an
+        ``(x, y)`` pair, as for `numpy.histogram2d`.
+
+    range : `tuple`
+        The ``((xmin, xmax), (ymin, ymax))`` range of the bins, required for
+        dimensions where the number of bins is given.
+
+    Attributes
+    ----------
+
+    counts : `numpy.ndarray`
+        The (weighted) number of values in each bin so far, indexed by
+        ``[x, y]`` like `numpy.histogram2d`.
+
+    xedges, yedges : `numpy.ndarray`
+        The bin edges.
+    """
+
+    def __init__(self, bins, range=None):
+        if np.ndim(bins) == 0 or len(bins) != 2:
+            xbins = ybins = bins
+        else:
+            xbins, ybins = bins
+        xrange, yrange = range if range is not None else (None, None)
+
+        self.xedges = _bin_edges(xbins, xrange)
+        self.yedges = _bin_edges(ybins, yrange)
+        self.counts = np.zeros((len(self.xedges) - 1, len(self.yedges) - 1))
+
+    def add(self, x, y, weights=None):
+        """
+        Add a chunk of ``(x, y)`` values, with optional weights, to the
+        histogram.
+        """
+        self.counts += np.histogram2d(x, y, [self.xedges, self.yedges],
+                                      weights=weights)[0]
+
+
+class StreamingBinnedStatistic(object):
+    """
+    A statistic of values in bins of one or more coordinates, accumulated
+    over chunks of data.
+
+    This is the streaming equivalent of ``scipy.stats.binned_statistic_dd``
+    for the statistics which can be computed incrementally. Values outside
+    the bins are ignored, the last bin in each dimension includes its upper
+    edge.
+
+    Parameters
+    ----------
+
+    bins : `list`
+        The bin edges, or number of bins, for each coordinate.
+
+    range : `list`
+        The ``(lower, upper)`` range of each coordinate, required for
+        coordinates where the number of bins is given.
+
+    statistic : `str`
+        One of ``'count'``, ``'sum'``, ``'mean'``, ``'std'``, ``'min'`` or
+        ``'max'``.
+
+    Attributes
+    ----------
+
+    edges : `list`
+        The bin edges for each coordinate.
+    """
+
+    statistics = ('count', 'sum', 'mean', 'std', 'min', 'max')
+
+    def __init__(self, bins, range=None, statistic='mean'):
+        if statistic not in self.statistics:
+            raise ValueError("statistic must be one of {}".format(
+                ', '.join(self.statistics)))
+        self.statistic = statistic
+
+        if range is None:
+            range = [None] * len(bins)
+        self.edges = [_bin_edges(dim_bins, dim_range)
+                      for dim_bins, dim_range in zip(bins, range)]
+        self.shape = tuple(len(edges) - 1 for edges in self.edges)
+
+        size = int(np.prod(self.shape))
+        self._count = np.zeros(size)
+        self._sum = np.zeros(size)
+        # The running mean and sum of squared deviations from it in each
+        # bin, merged per chunk (Chan et al.) so ``'std'`` keeps its
+        # precision for values with a large offset.
+        self._mean = np.zeros(size) if statistic == 'std' else None
+        self._m2 = np.zeros(size) if statistic == 'std' else None
+        self._extreme = None
+        if statistic == 'min':
+            self._extreme = np.full(size, np.inf)
+        elif statistic == 'max':
+            self._extreme = np.full(size, -np.inf)
+
+    def _flat_index(self, coords):
+        """
+        Return the flat bin index of each point, and a mask of the points
+        inside the bins.
+        """
+        indices = []
+        inside = True
+        for edges, coord in zip(self.edges, coords):
+            index = np.searchsorted(edges, coord, side='right') - 1
+            index[coord == edges[-1]] = len(edges) - 2
+            inside = inside & (index >= 0) & (index < len(edges) - 1)
+            indices.append(index)
+
+        indices = [index[inside] for index in indices]
+        return np.ravel_multi_index(indices, self.shape), inside
+
+    def add(self, coords, values=None):
+        """
+        Add a chunk of points.
+
+        Parameters
+        ----------
+
+        coords : `list` or `numpy.ndarray`
+            An array of coordinates for each dimension, or one array of
+            coordinates for one dimensional bins.
+
+        values : `numpy.ndarray`
+            The values at each point, not needed for ``'count'``.
+        """
+        if len(self.edges) == 1 and np.ndim(coords) == 1:
+            coords = [coords]
+        coords = [np.asarray(coord) for coord in coords]
+        flat, inside = self._flat_index(coords)
+        size = len(self._count)
+
+        count = np.bincount(flat, minlength=size)
+        previous = self._count.copy()
+        self._count += count
+        if self.statistic == 'count':
+            return
+
+        values = np.asarray(values)[inside]
+        total = np.bincount(flat, weights=values, minlength=size)
+        self._sum += total
+        if self._m2 is not None:
+            filled = count > 0
+            mean = np.zeros(size)
+            mean[filled] = total[filled] / count[filled]
+            m2 = np.bincount(flat, weights=(values - mean[flat]) ** 2,
+                             minlength=size)
+
+            delta = mean[filled] - self._mean[filled]
+            weight = count[filled] / self._count[filled]
+            self._mean[filled] += delta * weight
+            self._m2[filled] += (m2[filled] +
+                                 delta ** 2 * previous[filled] * weight)
+        if self.statistic == 'min':
+            np.minimum.at(self._extreme, flat, values)
+        elif self.statistic == 'max':
+            np.maximum.at(self._extreme, flat, values)
+
+    @property
+    def result(self):
+        """
+        The statistic in each bin so far, with the shape of the bins. Bins
+        with no values are NaN, except for ``'count'`` and ``'sum'`` which
+        are zero.
+        """
+        count = self._count
+        if self.statistic == 'count':
+            result = count.copy()
+        elif self.statistic == 'sum':
+            result = self._sum.copy()
+        else:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                if self.statistic == 'mean':
+                    result = self._sum / count
+                elif self.statistic == 'std':
+                    result = np.sqrt(self._m2 / count)
+                else:
+                    result = self._extreme.copy()
+            result[count == 0] = np.nan
+
+        return result.reshape(self.shape)
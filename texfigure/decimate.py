@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Reduction of the number of points in long line plots to the resolution they
+are drawn at.
+"""
+from __future__ import print_function, division
+import contextlib
+
+import numpy as np
+import matplotlib
+from matplotlib.lines import Line2D
+
+__all__ = ['minmax_indices', 'lttb_indices', 'decimate_lines']
+
+
+def _segment_extreme(y, starts, counts, reduce):
+    """
+    Return the index of the first point in each segment of ``y`` equal to
+    the segment's ``reduce`` (`numpy.minimum` or `numpy.maximum`) value.
+    """
+    segment = np.repeat(np.arange(len(starts)), counts)
+    extremes = reduce.reduceat(y, starts)
+    matches = np.flatnonzero(y == extremes[segment])
+    _, first = np.unique(segment[matches], return_index=True)
+    return matches[first]
+
+
+def minmax_indices(y, nout, x=None, xlim=None):
+    """
+    Return the indices of the points in the min/max envelope of ``y``.
+
+    The range ``xlim`` is split into ``(nout - 2) // 2`` equal width bins in
+    ``x``, and the smallest and largest point in each bin is kept, along
+    with the first and last points, so the drawn envelope of the line is
+    unchanged when each bin is narrower than a pixel. Points outside
+    ``xlim`` fall in the first or last bin.
+
+    Parameters
+    ----------
+
+    y : `numpy.ndarray`
+        The finite values of the line.
+
+    nout : `int`
+        The maximum number of points to keep, at least 2.
+
+    x : `numpy.ndarray`
+        The sorted, finite x coordinates of the line, defaults to the
+        indices of ``y``.
+
+    xlim : `tuple`
+        The ``(min, max)`` range of ``x`` to split into bins, defaults to
+        the range of ``x``.
+
+    Returns
+    -------
+
+    indices : `numpy.ndarray`
+        The sorted indices of the points to keep.
+    """
+    size = len(y)
+    if size <= nout:
+        return np.arange(size)
+
+    if x is None:
+        x = np.arange(size)
+    if xlim is None:
+        xlim = (x[0], x[-1])
+
+    nbins = max((nout - 2) // 2, 1)
+    edges = np.linspace(xlim[0], xlim[1], nbins + 1)
+    starts = np.searchsorted(x, edges[:-1], side='left')
+    starts[0] = 0
+    stops = np.append(starts[1:], size)
+
+    nonempty = stops > starts
+    starts, counts = starts[nonempty], (stops - starts)[nonempty]
+
+    indices = [np.array([0, size - 1]),
+               _segment_extreme(y, starts, counts, np.minimum),
+               _segment_extreme(y, starts, counts, np.maximum)]
+
+    return np.unique(np.concatenate(indices))
+
+
+def lttb_indices(x, y, nout):
+    """
+    Return the indices of the points picked by the Largest Triangle Three
+    Buckets algorithm.
+
+    The points between the first and last are split into ``nout - 2``
+    buckets, and from each bucket the point forming the largest triangle
+    with the point picked from the previous bucket and the mean of the next
+    bucket is kept.
+
+    Parameters
+    ----------
+
+    x, y : `numpy.ndarray`
+        The finite coordinates of the line, with ``x`` sorted.
+
+    nout : `int`
+        The number of points to keep, at least 3.
+
+    Returns
+    -------
+
+    indices : `numpy.ndarray`
+        The sorted indices of the points to keep.
+    """
+    size = len(x)
+    if size <= nout or nout < 3:
+        return np.arange(size)
+
+    edges = np.linspace(1, size - 1, nout - 1).astype(int)
+    counts = np.diff(edges)
+
+    # The mean of each bucket, with the last point as a final bucket.
+    mean_x = np.append(np.add.reduceat(x[:size - 1], edges[:-1]) / counts,
+                       x[-1])
+    mean_y = np.append(np.add.reduceat(y[:size - 1], edges[:-1]) / counts,
+                       y[-1])
+
+    indices = np.empty(nout, dtype=np.intp)
+    indices[0] = 0
+    indices[-1] = size - 1
+
+    picked = 0
+    for i in range(nout - 2):
+        start, stop = edges[i], edges[i + 1]
+        ax, ay = x[picked], y[picked]
+        area = np.abs((ax - mean_x[i + 1]) * (y[start:stop] - ay) -
+                      (ax - x[start:stop]) * (mean_y[i + 1] - ay))
+        picked = start + area.argmax()
+        indices[i + 1] = picked
+
+    return indices
+
+
+DECIMATION_METHODS = {'minmax': lambda x, y, nout, xlim: minmax_indices(
+                          y, nout, x=x, xlim=xlim),
+                      'lttb': lambda x, y, nout, xlim: lttb_indices(x, y, nout)}
+
+
+def _line_pixels(line, dpi):
+    """
+    Return the width in pixels of the axes ``line`` is drawn in.
+    """
+    fig = line.figure
+    return line.axes.get_position().width * fig.get_figwidth() * dpi
+
+
+def _visible_slice(x, xlim):
+    """
+    Return the slice of the sorted ``x`` inside ``xlim``, with one more
+    point either side, so the line is still drawn to the edge of the axes.
+    """
+    start = max(np.searchsorted(x, xlim[0], side='left') - 1, 0)
+    stop = min(np.searchsorted(x, xlim[1], side='right') + 1, len(x))
+    return slice(start, stop)
+
+
+@contextlib.contextmanager
+def decimate_lines(fig, method, dpi=None):
+    """
+    Decimate the long lines in ``fig`` to the resolution they are drawn at
+    for the duration of the context.
+
+    Each line is clipped to the x limits of its axes, keeping one point
+    either side, and reduced to two points per pixel of the width of its
+    axes, for the figure size and ``dpi``. The bins are equal width in the
+    scale of the x axis, so logarithmic axes are decimated per pixel too.
+    Only plain lines, without markers or steps, with sorted and finite data
+    are decimated.
+
+    Parameters
+    ----------
+
+    fig : `matplotlib.figure.Figure`
+        The figure.
+
+    method : `str` or `None`
+        ``'minmax'`` to keep the min/max envelope of the line, see
+        `~texfigure.decimate.minmax_indices`, or ``'lttb'`` for Largest
+        Triangle Three Buckets, see `~texfigure.decimate.lttb_indices`. If
+        `None` no lines are changed.
+
+    dpi : `float`
+        The resolution, defaults to ``savefig.dpi`` in `matplotlib.rcParams`.
+    """
+    if method is None:
+        yield []
+        return
+
+    if method not in DECIMATION_METHODS:
+        raise ValueError("Unknown decimation method {!r}, should be one of "
+                         "{}".format(method, sorted(DECIMATION_METHODS)))
+    pick = DECIMATION_METHODS[method]
+
+    if dpi is None:
+        dpi = matplotlib.rcParams['savefig.dpi']
+    if dpi == 'figure':
+        dpi = fig.dpi
+
+    decimated = []
+    for line in fig.findobj(Line2D):
+        if (line.axes is None or line.get_marker() not in ('None', '', ' ', None)
+                or line.get_drawstyle() != 'default'):
+            continue
+
+        nout = 2 * int(np.ceil(_line_pixels(line, dpi)))
+        xy = line.get_xydata()
+        if len(xy) <= nout:
+            continue
+
+        x, y = xy[:, 0], xy[:, 1]
+        if not (np.isfinite(xy).all() and (x[1:] >= x[:-1]).all()):
+            continue
+
+        xlim = np.sort(line.axes.get_xlim())
+        visible = _visible_slice(x, xlim)
+        x, y = x[visible], y[visible]
+
+        # Bin in the scale of the axis, i.e. log(x) for a log axis.
+        transform = line.axes.xaxis.get_transform()
+        xt = transform.transform(x)
+        if not np.isfinite(xt).all():
+            continue
+
+        indices = pick(xt, y, nout, transform.transform(xlim))
+        decimated.append((line, line.get_data(orig=True)))
+        line.set_data(x[indices], y[indices])
+
+    try:
+        yield [line for line, _ in decimated]
+    finally:
+        for line, data in decimated:
+            line.set_data(*data)
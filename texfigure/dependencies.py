@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Tracking of the data files and code used to generate each figure.
+"""
+from __future__ import print_function
+import os
+import json
+import hashlib
+import linecache
+import tempfile
+
+__all__ = ['DependencyGraph', 'FigureScope']
+
+
+def file_hash(path, blocksize=1 << 20):
+    """
+    Return the sha1 hex digest of the contents of a file.
+    """
+    sha = hashlib.sha1()
+    with open(path, 'rb') as fobj:
+        for block in iter(lambda: fobj.read(blocksize), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def block_source(filename, lineno):
+    """
+    Return the source of the block of code starting at ``lineno``, i.e. the
+    ``with`` statement on that line and all the lines indented under it.
+
+    Returns `None` if the source is not available.
+    """
+    lines = linecache.getlines(filename)
+    if not lines or lineno > len(lines):
+        return None
+
+    first = lines[lineno - 1]
+    indent = len(first) - len(first.lstrip())
+    block = [first.strip()]
+    for line in lines[lineno:]:
+        stripped = line.strip()
+        if stripped and len(line) - len(line.lstrip()) <= indent:
+            break
+        if stripped:
+            block.append(line.rstrip()[indent:])
+
+    return '\n'.join(block)
+
+
+class DependencyGraph(object):
+    """
+    A record of the inputs used to generate each figure reference.
+
+    For each reference the graph records the data files read while making
+    the figure (with their modification time, size and, for files smaller
+    than ``hash_size_limit``, a hash of their contents), a hash of the code
+    which generated it and the output files.
+
+    Parameters
+    ----------
+
+    filename : `str`
+        A JSON file in which to persist the graph. If `None` the graph is
+        only held in memory.
+
+    hash_size_limit : `int`
+        Files larger than this many bytes are compared by modification time
+        and size only.
+    """
+
+    def __init__(self, filename=None, hash_size_limit=64 * 2**20):
+        self.filename = filename
+        self.hash_size_limit = hash_size_limit
+        self._graph = {}
+
+        if filename and os.path.exists(filename):
+            try:
+                with open(filename) as fobj:
+                    self._graph = json.load(fobj)
+            except ValueError:
+                self._graph = {}
+
+    def __contains__(self, ref):
+        return ref in self._graph
+
+    def file_signature(self, path):
+        """
+        Return the ``[mtime, size, hash]`` signature of a file.
+        """
+        stat = os.stat(path)
+        sha = None
+        if stat.st_size <= self.hash_size_limit:
+            sha = file_hash(path)
+        return [stat.st_mtime, stat.st_size, sha]
+
+    def _file_changed(self, path, signature):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return True
+
+        mtime, size, sha = signature
+        if stat.st_size != size:
+            return True
+        if stat.st_mtime == mtime:
+            return False
+        # The file has been touched, but may not have changed.
+        return sha is None or file_hash(path) != sha
+
+    def record(self, ref, files, code=None, outputs=()):
+        """
+        Record the inputs and outputs of a figure.
+
+        Parameters
+        ----------
+
+        ref : `str`
+            The figure reference.
+
+        files : `list`
+            The data files used to generate the figure.
+
+        code : `str`
+            A hash of the code which generated the figure, `None` if unknown.
+
+        outputs : `list`
+            The files created for this figure.
+        """
+        entry = {'files': dict((path, self.file_signature(path))
+                               for path in files),
+                 'code': code,
+                 'outputs': list(outputs)}
+
+        if self._graph.get(ref) != entry:
+            self._graph[ref] = entry
+            self.save()
+
+    def files(self, ref):
+        """
+        The data files recorded for ``ref``.
+        """
+        return sorted(self._graph[ref]['files'])
+
+    def outputs(self, ref):
+        """
+        The output files recorded for ``ref``.
+        """
+        return self._graph[ref]['outputs']
+
+    def is_up_to_date(self, ref, code):
+        """
+        Return `True` if the figure ``ref`` was last generated by the same
+        code, none of its data files have changed and its outputs exist.
+        """
+        entry = self._graph.get(ref)
+        if entry is None or code is None or entry['code'] != code:
+            return False
+
+        if not entry['outputs'] or not all(os.path.exists(path)
+                                           for path in entry['outputs']):
+            return False
+
+        return not any(self._file_changed(path, signature)
+                       for path, signature in entry['files'].items())
+
+    def save(self):
+        """
+        Write the graph to ``filename``.
+        """
+        if not self.filename:
+            return
+
+        dirname = os.path.dirname(self.filename)
+        fdesc, tmpname = tempfile.mkstemp(dir=dirname, prefix='.tmp-')
+        with os.fdopen(fdesc, 'w') as fobj:
+            json.dump(self._graph, fobj, indent=1, sort_keys=True)
+        if os.name == 'nt' and os.path.exists(self.filename):
+            os.remove(self.filename)
+        os.rename(tmpname, self.filename)
+
+
+class FigureScope(object):
+    """
+    A context in which a single figure is generated by a
+    `~texfigure.Manager`, returned by `~texfigure.Manager.figure`.
+
+    The data files accessed through the manager inside the scope are
+    recorded as the dependencies of the figure, along with a hash of the
+    source of the ``with`` block. If neither has changed since the figure
+    was last saved, ``up_to_date`` is `True`, the previously saved figure is
+    registered with the manager and the code in the block can skip
+    regenerating it.
+
+    Attributes
+    ----------
+
+    ref : `str`
+        The figure reference.
+
+    code : `str`
+        A hash of the source of the ``with`` block, or `None` if the source
+        is not available.
+
+    up_to_date : `bool`
+        `True` if the figure does not need to be regenerated.
+
+    figure : `texfigure.Figure`
+        The figure registered with the manager for ``ref``, once it has been
+        saved or if it is up to date.
+    """
+
+    def __init__(self, manager, ref, code=None):
+        self.manager = manager
+        self.ref = ref
+        self.code = code
+        self.up_to_date = False
+        self.figure = None
+        self._outer_files = None
+
+    def __enter__(self):
+        manager = self.manager
+        self._outer_files = manager._touched_files
+        manager._touched_files = []
+        manager._active_scope = self
+
+        graph = manager._dependency_graph
+        self.up_to_date = graph.is_up_to_date(self.ref, self.code)
+        if self.up_to_date:
+            for path in graph.files(self.ref):
+                manager.pytex.add_dependencies(path)
+            self.figure = manager._restore_figure(self.ref,
+                                                  graph.outputs(self.ref)[0])
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        manager = self.manager
+        manager._active_scope = None
+        manager._touched_files = self._outer_files
+        if self.figure is None and self.ref in manager._figure_registry:
+            self.figure = manager.get_figure(self.ref)
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+"""
+Compilation of ``.pgf`` figures to standalone PDF files, so the main
+document can include the PDF rather than typesetting the plot code on every
+LaTeX pass.
+"""
+from __future__ import print_function
+import os
+import shutil
+import hashlib
+import tempfile
+import subprocess
+
+import six
+import matplotlib
+
+from .output import companion_files, copy_if_changed
+
+__all__ = ['compile_pgf', 'compile_pgf_pages', 'can_split_pages',
+           'external_filename']
+
+
+def external_filename(pgf_file):
+    """
+    Return the name of the PDF a ``.pgf`` file is compiled to.
+    """
+    return os.path.splitext(pgf_file)[0] + '-pgf.pdf'
+
+
+def _default_preamble():
+    preamble = matplotlib.rcParams['pgf.preamble']
+    if not isinstance(preamble, six.string_types):
+        preamble = '\n'.join(preamble)
+    return preamble
+
+
+def content_hash(pgf_file, texsystem, preamble):
+    """
+    Return a hash of a ``.pgf`` file, the raster images it includes and the
+    LaTeX setup it is compiled with.
+    """
+    sha = hashlib.sha1()
+    sha.update(texsystem.encode('utf-8'))
+    sha.update(preamble.encode('utf-8'))
+    for filename in [pgf_file] + companion_files(pgf_file):
+        sha.update(os.path.basename(filename).encode('utf-8'))
+        with open(filename, 'rb') as fobj:
+            sha.update(fobj.read())
+    return sha.hexdigest()
+
+
+def _batch_document(pgf_files, preamble):
+    """
+    Return a LaTeX document typesetting each ``.pgf`` file on its own page,
+    cropped to the figure. `None` entries give an empty page.
+    """
+    lines = [r'\documentclass{article}',
+             r'\usepackage{pgf}',
+             r'\usepackage{import}',
+             preamble,
+             r'\usepackage[active,tightpage]{preview}',
+             r'\setlength\PreviewBorder{0pt}',
+             r'\begin{document}']
+    for pgf_file in pgf_files:
+        if pgf_file is None:
+            lines.append(r'\begin{preview}\mbox{}\end{preview}')
+            continue
+        dirname, fname = os.path.split(os.path.abspath(pgf_file))
+        lines.append(r'\begin{{preview}}\import{{{}/}}{{{}}}\end{{preview}}'
+                     .format(dirname.replace(os.sep, '/'), fname))
+    lines.append(r'\end{document}')
+    return '\n'.join(lines) + '\n'
+
+
+def _run_latex(pgf_files, texsystem, preamble, build_dir, jobname):
+    """
+    Compile a batch of ``.pgf`` files into one PDF, returning its path.
+    """
+    with open(os.path.join(build_dir, jobname + '.tex'), 'w') as fobj:
+        fobj.write(_batch_document(pgf_files, preamble))
+
+    try:
+        subprocess.check_output([texsystem, '-interaction=nonstopmode',
+                                 '-halt-on-error', jobname + '.tex'],
+                                cwd=build_dir, stderr=subprocess.STDOUT)
+    except subprocess.CalledProcessError as err:
+        output = err.output.decode('utf-8', 'replace').splitlines()
+        raise RuntimeError("Compiling {} pgf figure(s) with {} failed:\n{}"
+                           .format(len(pgf_files), texsystem,
+                                   '\n'.join(output[-20:])))
+
+    return os.path.join(build_dir, jobname + '.pdf')
+
+
+def _pdf_splitter():
+    """
+    Return the PDF reader and writer classes of pypdf or PyPDF2, or `None`
+    if neither is installed.
+    """
+    try:
+        from pypdf import PdfReader, PdfWriter
+    except ImportError:
+        try:
+            from PyPDF2 import PdfReader, PdfWriter
+        except ImportError:
+            try:
+                from PyPDF2 import PdfFileReader as PdfReader
+                from PyPDF2 import PdfFileWriter as PdfWriter
+            except ImportError:
+                return None
+    return PdfReader, PdfWriter
+
+
+def can_split_pages():
+    """
+    Return `True` if pypdf or PyPDF2 is installed, so
+    `~texfigure.externalize.compile_pgf` can split a compiled batch of
+    figures into separate PDF files.
+    """
+    return _pdf_splitter() is not None
+
+
+def _split_pages(filename, outputs, splitter):
+    """
+    Write each page of ``filename`` to the corresponding file in
+    ``outputs``.
+    """
+    PdfReader, PdfWriter = splitter
+    with open(filename, 'rb') as fobj:
+        reader = PdfReader(fobj)
+        if hasattr(reader, 'pages'):
+            pages = list(reader.pages)
+        else:
+            pages = [reader.getPage(i) for i in range(reader.getNumPages())]
+        if len(pages) != len(outputs):
+            raise RuntimeError("Expected {} pages compiling pgf figures, got "
+                               "{}".format(len(outputs), len(pages)))
+
+        for page, output in zip(pages, outputs):
+            writer = PdfWriter()
+            if hasattr(writer, 'add_page'):
+                writer.add_page(page)
+            else:
+                writer.addPage(page)
+            with open(output, 'wb') as out:
+                writer.write(out)
+
+
+def _latex_setup(texsystem, preamble, cache_dir):
+    """
+    Fill in the default LaTeX command and preamble, and create the cache
+    directory.
+    """
+    if texsystem is None:
+        texsystem = matplotlib.rcParams['pgf.texsystem']
+    if preamble is None:
+        preamble = _default_preamble()
+
+    if cache_dir and not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+
+    return texsystem, preamble
+
+
+def compile_pgf(files, cache_dir=None, texsystem=None, preamble=None):
+    """
+    Compile ``.pgf`` files to standalone PDF files.
+
+    All the files which are not in the cache are typeset in a single LaTeX
+    run using the ``preview`` package, one cropped page per figure, and the
+    pages are then split into separate PDF files with ``pypdf`` or
+    ``PyPDF2``. If neither is installed, use
+    `~texfigure.externalize.compile_pgf_pages` to keep the figures as the
+    pages of one PDF.
+
+    Parameters
+    ----------
+
+    files : `list`
+        ``(pgf_file, pdf_file)`` pairs of the files to compile and the PDF
+        files to write.
+
+    cache_dir : `str`
+        A directory of compiled PDF files keyed by a hash of the ``.pgf``
+        file, its raster images and the LaTeX setup. Figures which have
+        been compiled before are copied from here.
+
+    texsystem : `str`
+        The LaTeX command, defaults to ``pgf.texsystem`` in
+        `matplotlib.rcParams`.
+
+    preamble : `str`
+        The LaTeX preamble, defaults to ``pgf.preamble`` in
+        `matplotlib.rcParams`. It should load the same fonts as the main
+        document.
+
+    Returns
+    -------
+
+    compiled : `list`
+        The PDF files which were compiled, rather than copied from the
+        cache.
+
+    Raises
+    ------
+
+    RuntimeError
+        If figures need compiling and neither ``pypdf`` nor ``PyPDF2`` is
+        installed.
+    """
+    texsystem, preamble = _latex_setup(texsystem, preamble, cache_dir)
+
+    jobs = []
+    for pgf_file, pdf_file in files:
+        key = content_hash(pgf_file, texsystem, preamble)
+        cached = os.path.join(cache_dir, key + '.pdf') if cache_dir else None
+        if cached and os.path.exists(cached):
+            copy_if_changed(cached, pdf_file)
+        else:
+            jobs.append((pgf_file, pdf_file, cached))
+
+    if not jobs:
+        return []
+
+    splitter = _pdf_splitter()
+    if splitter is None:
+        raise RuntimeError("Splitting compiled pgf figures into separate PDF "
+                           "files needs pypdf or PyPDF2, use "
+                           "compile_pgf_pages to keep them in one PDF")
+
+    build_dir = tempfile.mkdtemp(prefix='texfigure-pgf-')
+    try:
+        batch = _run_latex([job[0] for job in jobs], texsystem, preamble,
+                           build_dir, 'texfigure-batch')
+        pages = [os.path.join(build_dir, 'page{}.pdf'.format(i))
+                 for i in range(len(jobs))]
+        _split_pages(batch, pages, splitter)
+        for page, (_, pdf_file, _) in zip(pages, jobs):
+            copy_if_changed(page, pdf_file)
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+    for _, pdf_file, cached in jobs:
+        if cached:
+            copy_if_changed(pdf_file, cached)
+
+    return [job[1] for job in jobs]
+
+
+def compile_pgf_pages(pgf_files, pdf_file, cache_dir=None, texsystem=None,
+                      preamble=None):
+    """
+    Compile ``.pgf`` files to the pages of a single PDF file, without
+    splitting them into separate files.
+
+    The figures are typeset in one LaTeX run as in
+    `~texfigure.externalize.compile_pgf`, and page ``n`` of ``pdf_file``
+    is the figure in ``pgf_files[n - 1]``, which can be included with
+    ``\\includegraphics[page=n]``. Files which do not exist are replaced by
+    an empty page, so the page numbers do not change.
+
+    Parameters
+    ----------
+
+    pgf_files : `list`
+        The ``.pgf`` files to compile, in page order.
+
+    pdf_file : `str`
+        The PDF file to write.
+
+    cache_dir : `str`
+        A directory of compiled PDF files keyed by a hash of all the
+        ``.pgf`` files, their raster images and the LaTeX setup. If the
+        same figures have been compiled before the PDF is copied from here.
+
+    texsystem : `str`
+        The LaTeX command, defaults to ``pgf.texsystem`` in
+        `matplotlib.rcParams`.
+
+    preamble : `str`
+        The LaTeX preamble, defaults to ``pgf.preamble`` in
+        `matplotlib.rcParams`.
+
+    Returns
+    -------
+
+    compiled : `bool`
+        `True` if the figures were compiled, rather than copied from the
+        cache.
+    """
+    texsystem, preamble = _latex_setup(texsystem, preamble, cache_dir)
+
+    pgf_files = [pgf_file if os.path.exists(pgf_file) else None
+                 for pgf_file in pgf_files]
+
+    sha = hashlib.sha1()
+    for pgf_file in pgf_files:
+        if pgf_file is None:
+            sha.update(b'empty')
+        else:
+            sha.update(content_hash(pgf_file, texsystem,
+                                    preamble).encode('utf-8'))
+    cached = None
+    if cache_dir:
+        cached = os.path.join(cache_dir, 'pages-' + sha.hexdigest() + '.pdf')
+        if os.path.exists(cached):
+            copy_if_changed(cached, pdf_file)
+            return False
+
+    build_dir = tempfile.mkdtemp(prefix='texfigure-pgf-')
+    try:
+        batch = _run_latex(pgf_files, texsystem, preamble, build_dir,
+                           'texfigure-batch')
+        copy_if_changed(batch, pdf_file)
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+    if cached:
+        copy_if_changed(pdf_file, cached)
+
+    return True
@@ -0,0 +1,444 @@
+# -*- coding: utf-8 -*-
+"""
+Management of the LaTeX processes matplotlib's pgf backend uses to lay out
+text.
+"""
+from __future__ import print_function
+import os
+import json
+import atexit
+import hashlib
+import tempfile
+import warnings
+import threading
+import subprocess
+
+import matplotlib
+
+__all__ = ['latex_header', 'keep_latex_managers', 'get_latex_manager',
+           'warm_latex_manager', 'build_format', 'use_format',
+           'TextMetricsCache', 'cache_text_metrics']
+
+# The LatexManager for each (texsystem, header) used in this session.
+_latex_managers = {}
+_latex_managers_lock = threading.RLock()
+
+# The directory of precompiled formats used for the pgf header, if enabled.
+_format_dir = None
+# The format name for each (texsystem, preamble), None if it failed to build.
+_formats = {}
+# The version banner of each TeX system, see tex_version.
+_tex_versions = {}
+
+BEGIN_DOCUMENT = r'\begin{document}'
+
+# The text metrics cache consulted by the pgf backend, if enabled.
+_text_metrics = None
+
+# The TeX systems which can dump a format with mylatexformat.
+FORMAT_TEXSYSTEMS = ('pdflatex', 'xelatex')
+
+
+def _pgf_backend():
+    from matplotlib.backends import backend_pgf
+    return backend_pgf
+
+
+def latex_header():
+    """
+    Return the LaTeX header the pgf backend starts its LaTeX process with,
+    which is built from the ``pgf`` settings in ``rcParams``.
+    """
+    return _pgf_backend().LatexManager._build_latex_header()
+
+
+def tex_version(texsystem):
+    """
+    Return the first line of ``texsystem --version``, or an empty string if
+    it can not be run. The result is cached for the session.
+    """
+    if texsystem not in _tex_versions:
+        try:
+            output = subprocess.check_output([texsystem, '--version'],
+                                             stderr=subprocess.STDOUT)
+            version = output.decode('utf-8', 'replace').strip()
+            _tex_versions[texsystem] = version.splitlines()[0] if version else ''
+        except (OSError, subprocess.CalledProcessError):
+            _tex_versions[texsystem] = ''
+    return _tex_versions[texsystem]
+
+
+def format_name(preamble, texsystem):
+    """
+    Return the name of the format file for a preamble, which includes a hash
+    of the preamble, the TeX system and its version banner.
+
+    A format can only be loaded by the TeX engine which dumped it, so
+    including the version means a TeX upgrade builds a new format rather
+    than loading a stale one.
+    """
+    sha = hashlib.sha1(texsystem.encode('utf-8'))
+    sha.update(tex_version(texsystem).encode('utf-8'))
+    sha.update(preamble.encode('utf-8'))
+    return 'texfigure-{}'.format(sha.hexdigest()[:16])
+
+
+def build_format(preamble, texsystem, fmt_dir):
+    """
+    Dump a LaTeX preamble into a precompiled format file, using the
+    ``mylatexformat`` package.
+
+    The format is only built if a format for the same preamble and TeX
+    system is not already in ``fmt_dir``.
+
+    Parameters
+    ----------
+
+    preamble : `str`
+        The LaTeX source up to, but not including, ``\\begin{document}``,
+        starting with the ``\\documentclass``.
+
+    texsystem : `str`
+        The LaTeX command, ``pdflatex`` or ``xelatex``.
+
+    fmt_dir : `str`
+        The directory to write the format to.
+
+    Returns
+    -------
+
+    name : `str` or `None`
+        The name of the format, or `None` if it could not be built.
+    """
+    if texsystem not in FORMAT_TEXSYSTEMS:
+        return None
+
+    name = format_name(preamble, texsystem)
+    fmt_file = os.path.join(fmt_dir, name + '.fmt')
+    if os.path.exists(fmt_file):
+        return name
+
+    if not os.path.exists(fmt_dir):
+        os.makedirs(fmt_dir)
+
+    # Build under a unique job name so concurrent sessions do not collide.
+    jobname = '{}-{}'.format(name, os.getpid())
+    with open(os.path.join(fmt_dir, jobname + '.tex'), 'w') as fobj:
+        fobj.write(preamble)
+        fobj.write('\n' + BEGIN_DOCUMENT + '\n\\end{document}\n')
+
+    try:
+        subprocess.check_output([texsystem, '-ini', '-interaction=nonstopmode',
+                                 '-halt-on-error', '-jobname=' + jobname,
+                                 '&' + texsystem, 'mylatexformat.ltx',
+                                 jobname + '.tex'],
+                                cwd=fmt_dir, stderr=subprocess.STDOUT)
+        os.rename(os.path.join(fmt_dir, jobname + '.fmt'), fmt_file)
+    except (OSError, subprocess.CalledProcessError) as err:
+        warnings.warn("Could not build a LaTeX format for the pgf preamble: "
+                      "{}".format(err))
+        return None
+    finally:
+        for ext in ('.tex', '.log', '.fmt'):
+            path = os.path.join(fmt_dir, jobname + ext)
+            if os.path.exists(path):
+                os.remove(path)
+
+    return name
+
+
+def _format_header(header):
+    """
+    Replace the preamble in ``header`` with an instruction to load the
+    precompiled format of the preamble, building it if needed.
+    """
+    preamble, sep, body = header.partition(BEGIN_DOCUMENT)
+    if _format_dir is None or not sep:
+        return header
+
+    texsystem = matplotlib.rcParams['pgf.texsystem']
+    key = (texsystem, preamble)
+    if key not in _formats:
+        _formats[key] = build_format(preamble, texsystem, _format_dir)
+
+    name = _formats[key]
+    if name is None:
+        return header
+
+    # TeX loads the format named by an & at the start of the first line.
+    return '&{}\n{}{}'.format(name, sep, body)
+
+
+def use_format(fmt_dir):
+    """
+    Make the pgf backend start LaTeX from a precompiled format of its
+    preamble, rather than parsing the preamble every time.
+
+    Formats are stored in ``fmt_dir``, keyed by a hash of the preamble and
+    TeX system, and built the first time each preamble is used. If a
+    format can not be built (for instance if ``mylatexformat`` is not
+    installed, or for ``lualatex``) the preamble is used as normal.
+
+    Parameters
+    ----------
+
+    fmt_dir : `str`
+        The directory to cache the formats in.
+
+    Notes
+    -----
+
+    This applies to the LaTeX process used to measure text, the LaTeX runs
+    matplotlib makes to compile ``.pdf`` files through the pgf backend
+    write their own preamble.
+    """
+    global _format_dir
+
+    _format_dir = os.path.abspath(fmt_dir)
+    if not os.path.exists(_format_dir):
+        os.makedirs(_format_dir)
+
+    texformats = os.environ.get('TEXFORMATS', '')
+    if _format_dir not in texformats.split(os.pathsep):
+        # A trailing separator makes kpathsea also search the default path.
+        os.environ['TEXFORMATS'] = os.pathsep.join([_format_dir, texformats])
+
+    LatexManager = _pgf_backend().LatexManager
+    if getattr(LatexManager, '_texfigure_build_header', None) is None:
+        build_header = LatexManager._build_latex_header
+        LatexManager._texfigure_build_header = staticmethod(build_header)
+        LatexManager._build_latex_header = staticmethod(
+            lambda: _format_header(build_header()))
+
+
+def get_latex_manager():
+    """
+    Return the pgf backend's ``LatexManager`` for the current ``rcParams``.
+
+    One manager, and so one running LaTeX process, is kept for each LaTeX
+    header and TeX system used in the session, so switching between
+    settings does not restart LaTeX.
+    """
+    return _latex_manager(latex_header())
+
+
+def _latex_manager(header):
+    key = (matplotlib.rcParams['pgf.texsystem'], header)
+    with _latex_managers_lock:
+        if key not in _latex_managers:
+            _latex_managers[key] = _pgf_backend().LatexManager()
+        return _latex_managers[key]
+
+
+def _clear_latex_managers():
+    """
+    Discard all the kept managers, matplotlib calls this through
+    ``LatexManager._get_cached_or_new_impl.cache_clear`` when a LaTeX
+    process is broken.
+    """
+    with _latex_managers_lock:
+        _latex_managers.clear()
+
+
+def _cached_or_new_impl(cls, header):
+    return _latex_manager(header)
+
+
+_cached_or_new_impl.cache_clear = _clear_latex_managers
+
+
+def keep_latex_managers():
+    """
+    Make matplotlib's pgf backend use `~texfigure.latex.get_latex_manager`.
+
+    Matplotlib only keeps the ``LatexManager`` for the most recent header,
+    and starts a new LaTeX process whenever the header changes. After this
+    has been called every manager is kept for the rest of the session, or
+    until matplotlib discards its cached manager because the LaTeX process
+    is broken.
+
+    Returns
+    -------
+
+    installed : `bool`
+        `False` if the installed version of matplotlib is not supported.
+    """
+    pgf = _pgf_backend()
+    LatexManager = pgf.LatexManager
+    if getattr(LatexManager, '_texfigure_kept', False):
+        return True
+
+    if hasattr(LatexManager, '_get_cached_or_new_impl'):
+        LatexManager._get_cached_or_new_impl = classmethod(_cached_or_new_impl)
+    elif hasattr(LatexManager, '_get_cached_or_new'):
+        LatexManager._get_cached_or_new = classmethod(
+            lambda cls: get_latex_manager())
+    elif hasattr(pgf, 'LatexManagerFactory'):
+        pgf.LatexManagerFactory.get_latex_manager = staticmethod(
+            get_latex_manager)
+    else:
+        return False
+
+    LatexManager._texfigure_kept = True
+    return True
+
+
+def warm_latex_manager():
+    """
+    Start the LaTeX process for the current ``rcParams`` in a background
+    thread, so LaTeX starts up while the figures are being made.
+
+    Returns
+    -------
+
+    thread : `threading.Thread`
+        The thread starting the process.
+    """
+    keep_latex_managers()
+    thread = threading.Thread(target=get_latex_manager,
+                              name='texfigure-latex-warmup')
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+class TextMetricsCache(object):
+    """
+    A persistent cache of the width, height and descent LaTeX reports for
+    each string the pgf backend lays out.
+
+    Entries are keyed by a hash of the LaTeX header (which includes the
+    preamble), the string and the size, family, style, weight, variant and
+    stretch of the font, so tick and axis labels repeated across figures and
+    builds are only measured by LaTeX once.
+
+    Parameters
+    ----------
+
+    filename : `str`
+        The JSON file to store the cache in, if `None` the cache is only
+        held in memory.
+    """
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self._metrics = {}
+        self._changed = False
+
+        if filename and os.path.exists(filename):
+            with open(filename) as fobj:
+                self._metrics = json.load(fobj)
+
+    @staticmethod
+    def header_hash(header):
+        """
+        Return the hash of a LaTeX header used in the cache keys.
+        """
+        return hashlib.sha1(header.encode('utf-8')).hexdigest()[:16]
+
+    @staticmethod
+    def key(header_hash, text, prop):
+        """
+        Return the cache key for ``text`` in the font ``prop``, a
+        `matplotlib.font_manager.FontProperties`.
+        """
+        return '{}:{}'.format(header_hash, json.dumps(
+            [text, prop.get_size_in_points(), prop.get_family(),
+             prop.get_style(), prop.get_weight(), prop.get_variant(),
+             prop.get_stretch()]))
+
+    def __len__(self):
+        return len(self._metrics)
+
+    def get(self, key):
+        """
+        Return the ``(width, height, descent)`` stored for ``key``, or
+        `None`.
+        """
+        metrics = self._metrics.get(key)
+        return tuple(metrics) if metrics is not None else None
+
+    def set(self, key, metrics):
+        """
+        Store the ``(width, height, descent)`` for ``key``.
+        """
+        self._metrics[key] = list(metrics)
+        self._changed = True
+
+    def save(self):
+        """
+        Write the cache to ``filename``, if it has changed.
+        """
+        if not self.filename or not self._changed:
+            return
+
+        dirname = os.path.dirname(os.path.abspath(self.filename))
+        fdesc, tmpname = tempfile.mkstemp(dir=dirname, prefix='.tmp-')
+        with os.fdopen(fdesc, 'w') as fobj:
+            json.dump(self._metrics, fobj)
+        if os.name == 'nt' and os.path.exists(self.filename):
+            os.remove(self.filename)
+        os.rename(tmpname, self.filename)
+        self._changed = False
+
+
+def _cached_width_height_descent(measure):
+    """
+    Wrap ``LatexManager.get_width_height_descent`` to consult the text
+    metrics cache.
+    """
+    def get_width_height_descent(self, text, prop):
+        if _text_metrics is None:
+            return measure(self, text, prop)
+
+        header_hash = getattr(self, '_texfigure_header_hash', None)
+        if header_hash is None:
+            # Managers are made for the current header, so this is the
+            # header the LaTeX process was started with.
+            header_hash = TextMetricsCache.header_hash(latex_header())
+            self._texfigure_header_hash = header_hash
+
+        key = TextMetricsCache.key(header_hash, text, prop)
+        metrics = _text_metrics.get(key)
+        if metrics is None:
+            metrics = measure(self, text, prop)
+            _text_metrics.set(key, metrics)
+        return metrics
+
+    return get_width_height_descent
+
+
+def cache_text_metrics(filename=None):
+    """
+    Make the pgf backend look up the size of text in a
+    `~texfigure.latex.TextMetricsCache` before asking LaTeX.
+
+    The cache is saved when the Python session exits.
+
+    Parameters
+    ----------
+
+    filename : `str`
+        The JSON file to store the cache in, if `None` the cache is only
+        held in memory.
+
+    Returns
+    -------
+
+    cache : `~texfigure.latex.TextMetricsCache`
+        The cache.
+    """
+    global _text_metrics
+
+    if _text_metrics is not None:
+        _text_metrics.save()
+    _text_metrics = TextMetricsCache(filename)
+
+    LatexManager = _pgf_backend().LatexManager
+    if not getattr(LatexManager, '_texfigure_metrics', False):
+        LatexManager.get_width_height_descent = _cached_width_height_descent(
+            LatexManager.get_width_height_descent)
+        LatexManager._texfigure_metrics = True
+        atexit.register(lambda: _text_metrics and _text_metrics.save())
+
+    return _text_metrics
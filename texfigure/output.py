@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Writing of figure files which leaves unchanged files untouched, so build
+tools watching their modification times do not rebuild the document.
+"""
+from __future__ import print_function
+import os
+import re
+import shutil
+import filecmp
+import tempfile
+
+__all__ = ['companion_files', 'strip_volatile', 'files_equal',
+           'replace_if_changed', 'copy_if_changed', 'save_if_changed']
+
+# Metadata which changes every time a file is written, by extension.
+VOLATILE_PATTERNS = {
+    '.pdf': [re.compile(br'/CreationDate\s*\([^)]*\)'),
+             re.compile(br'/ModDate\s*\([^)]*\)'),
+             re.compile(br'/Producer\s*\([^)]*\)'),
+             re.compile(br'/ID\s*\[\s*<[0-9A-Fa-f]*>\s*<[0-9A-Fa-f]*>\s*\]')],
+    '.ps': [re.compile(br'%%CreationDate:[^\r\n]*')],
+    '.eps': [re.compile(br'%%CreationDate:[^\r\n]*')],
+    '.svg': [re.compile(br'<dc:date>[^<]*</dc:date>')],
+}
+
+
+def companion_files(filename):
+    """
+    Return the list of files written alongside ``filename`` by a save.
+
+    The pgf backend writes any raster images in a figure to separate
+    ``<name>-img<n>.png`` files next to the ``.pgf`` file.
+    """
+    base, ext = os.path.splitext(filename)
+    if ext != '.pgf':
+        return []
+
+    dirname, prefix = os.path.split(base)
+    prefix += '-img'
+    return sorted(os.path.join(dirname, name)
+                  for name in os.listdir(dirname or os.curdir)
+                  if name.startswith(prefix) and name.endswith('.png'))
+
+
+def strip_volatile(data, ext):
+    """
+    Remove the metadata which changes every time a file is written, such as
+    the PDF ``CreationDate``, from the contents of a file.
+
+    Parameters
+    ----------
+
+    data : `bytes`
+        The contents of the file.
+
+    ext : `str`
+        The extension of the file, used to pick the metadata to remove.
+    """
+    for pattern in VOLATILE_PATTERNS.get(ext.lower(), []):
+        data = pattern.sub(b'', data)
+    return data
+
+
+def files_equal(new, old):
+    """
+    Return `True` if two files have the same content, ignoring volatile
+    metadata, see `~texfigure.output.strip_volatile`.
+    """
+    if not os.path.exists(old):
+        return False
+
+    ext = os.path.splitext(old)[1].lower()
+    if ext not in VOLATILE_PATTERNS:
+        return filecmp.cmp(new, old, shallow=False)
+
+    with open(new, 'rb') as fobj:
+        new_data = fobj.read()
+    with open(old, 'rb') as fobj:
+        old_data = fobj.read()
+    return (new_data == old_data or
+            strip_volatile(new_data, ext) == strip_volatile(old_data, ext))
+
+
+def _replace(src, dst):
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    else:
+        if os.name == 'nt' and os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+
+def replace_if_changed(src, dst):
+    """
+    Move ``src`` to ``dst`` if the contents differ, otherwise remove
+    ``src`` and leave ``dst``, and its modification time, unchanged.
+
+    ``src`` should be on the same filesystem as ``dst``, so the move is
+    atomic.
+
+    Returns
+    -------
+
+    changed : `bool`
+        `True` if ``dst`` was replaced.
+    """
+    if files_equal(src, dst):
+        os.remove(src)
+        return False
+
+    _replace(src, dst)
+    return True
+
+
+def copy_if_changed(src, dst):
+    """
+    Copy ``src`` to ``dst`` if the contents differ, replacing ``dst``
+    atomically.
+
+    Returns
+    -------
+
+    changed : `bool`
+        `True` if ``dst`` was replaced.
+    """
+    if files_equal(src, dst):
+        return False
+
+    fdesc, tmpname = tempfile.mkstemp(dir=os.path.dirname(dst) or os.curdir,
+                                      prefix='.tmp-')
+    os.close(fdesc)
+    shutil.copyfile(src, tmpname)
+    _replace(tmpname, dst)
+    return True
+
+
+def save_if_changed(save_function, fig, filename, **kwargs):
+    """
+    Save a figure to a temporary directory next to ``filename``, and only
+    replace the existing file, and any companion files, if they have
+    changed.
+
+    Parameters
+    ----------
+
+    save_function : callable
+        Called as ``save_function(fig, filename, **kwargs)``, returning the
+        name of the saved file.
+
+    fig : object
+        The figure.
+
+    filename : `str`
+        The file name to save to.
+
+    Returns
+    -------
+
+    filename : `str`
+        The file name as saved to disk.
+    """
+    dirname, basename = os.path.split(filename)
+    tmp_dir = tempfile.mkdtemp(dir=dirname or os.curdir, prefix='.tmp-')
+    try:
+        saved = save_function(fig, os.path.join(tmp_dir, basename), **kwargs)
+        for afile in [saved] + companion_files(saved):
+            replace_if_changed(afile,
+                               os.path.join(dirname, os.path.basename(afile)))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return os.path.join(dirname, os.path.basename(saved))
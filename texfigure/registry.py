@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+A registry of the figures saved by a `~texfigure.Manager`, which can be
+persisted between PythonTeX sessions.
+"""
+from __future__ import print_function
+import pickle
+import sqlite3
+from collections import OrderedDict
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+__all__ = ['FigureRegistry']
+
+
+class FigureRegistry(MutableMapping):
+    """
+    An ordered mapping of figure reference to a ``{'number': int, 'Figure':
+    texfigure.Figure}`` entry.
+
+    Entries added in this session are held in memory. If a database file is
+    given, entries are also written to an SQLite database keyed by the
+    manager number and the reference, and references not registered in this
+    session are looked up in the database, so figures saved in one session
+    can be retrieved in another.
+
+    Parameters
+    ----------
+
+    filename : `str`
+        The SQLite database file, if `None` the registry is held in memory.
+
+    manager_number : `int`
+        The number of the manager owning this registry.
+    """
+
+    def __init__(self, filename=None, manager_number=1):
+        self.filename = filename
+        self.manager_number = manager_number
+        self._entries = OrderedDict()
+        self._loaded = {}
+        self._conn = None
+
+        if filename:
+            self._conn = sqlite3.connect(filename, timeout=60)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            with self._conn:
+                self._conn.execute("CREATE TABLE IF NOT EXISTS figures ("
+                                   "manager INTEGER, ref TEXT, number INTEGER,"
+                                   " figure BLOB, PRIMARY KEY (manager, ref))")
+
+    def _store(self, ref, entry):
+        data = pickle.dumps(entry['Figure'], protocol=pickle.HIGHEST_PROTOCOL)
+        with self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO figures VALUES "
+                               "(?, ?, ?, ?)",
+                               (self.manager_number, ref, entry['number'],
+                                sqlite3.Binary(data)))
+
+    def _stored_refs(self):
+        if self._conn is None:
+            return []
+        cursor = self._conn.execute("SELECT ref FROM figures WHERE manager=? "
+                                    "ORDER BY number", (self.manager_number,))
+        return [ref for ref, in cursor]
+
+    def __getitem__(self, ref):
+        if ref in self._entries:
+            return self._entries[ref]
+        if ref in self._loaded or self._conn is None:
+            return self._loaded[ref]
+
+        row = self._conn.execute("SELECT number, figure FROM figures WHERE "
+                                 "manager=? AND ref=?",
+                                 (self.manager_number, ref)).fetchone()
+        if row is None:
+            raise KeyError(ref)
+
+        number, data = row
+        entry = {'number': number, 'Figure': pickle.loads(bytes(data))}
+        self._loaded[ref] = entry
+        return entry
+
+    def __setitem__(self, ref, entry):
+        self._entries[ref] = entry
+        if self._conn is not None:
+            self._store(ref, entry)
+
+    def __delitem__(self, ref):
+        self._loaded.pop(ref, None)
+        found = self._entries.pop(ref, None) is not None
+        if self._conn is not None:
+            with self._conn:
+                cursor = self._conn.execute("DELETE FROM figures WHERE "
+                                            "manager=? AND ref=?",
+                                            (self.manager_number, ref))
+            found = found or cursor.rowcount > 0
+        if not found:
+            raise KeyError(ref)
+
+    def __contains__(self, ref):
+        if ref in self._entries:
+            return True
+        try:
+            self[ref]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        for ref in self._entries:
+            yield ref
+        for ref in self._stored_refs():
+            if ref not in self._entries:
+                yield ref
+
+    def __len__(self):
+        return len(set(self._entries).union(self._stored_refs()))
+
+    def session_entry(self, ref):
+        """
+        Return the entry for ``ref`` if it was registered in this session,
+        otherwise `None`.
+        """
+        return self._entries.get(ref)
+
+    def session_count(self):
+        """
+        Return the number of references registered in this session.
+        """
+        return len(self._entries)
+
+    def session_items(self):
+        """
+        Return the ``(ref, entry)`` pairs registered in this session, in the
+        order they were registered, leaving out entries only found in the
+        database.
+        """
+        return list(self._entries.items())
+
+    def sync(self):
+        """
+        Write the entries registered in this session to the database, so
+        changes made to the `~texfigure.Figure` objects since they were
+        registered are persisted.
+        """
+        if self._conn is None:
+            return
+        for ref, entry in self._entries.items():
+            self._store(ref, entry)
+
+    def close(self):
+        """
+        Sync and close the database.
+        """
+        if self._conn is not None:
+            self.sync()
+            self._conn.close()
+            self._conn = None
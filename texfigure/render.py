@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+Functions for rendering figures to files, optionally in background processes.
+"""
+from __future__ import print_function
+import os
+import pickle
+import importlib
+import contextlib
+from timeit import default_timer
+
+import matplotlib
+from matplotlib.lines import Line2D
+from matplotlib.collections import Collection
+
+from .decimate import decimate_lines
+
+__all__ = ['save_mpl_figure', 'count_vertices', 'rasterize_dense_artists',
+           'RenderQueue', 'RASTER_BACKENDS', 'deterministic_environment']
+
+VECTOR_FORMATS = ('.pgf', '.pdf', '.svg', '.eps', '.ps')
+
+# The backend used for each raster format, the pgf backend renders these by
+# compiling the figure with LaTeX and converting the PDF.
+RASTER_BACKENDS = {'.png': 'agg', '.jpg': 'agg', '.jpeg': 'agg',
+                   '.tif': 'agg', '.tiff': 'agg', '.raw': 'agg',
+                   '.rgba': 'agg'}
+
+# The metadata which records when a file was written, removed from each
+# format in deterministic mode. PostScript dates come from SOURCE_DATE_EPOCH.
+VOLATILE_METADATA = {'.pdf': {'CreationDate': None},
+                     '.svg': {'Date': None}}
+
+# The salt for SVG ids in deterministic mode, which are random otherwise.
+SVG_HASHSALT = 'texfigure'
+
+_MPL_VERSION = tuple(int(part) for part in
+                     matplotlib.__version__.split('.')[:2])
+
+# savefig accepts a backend keyword from matplotlib 3.1, and metadata for
+# PDF and SVG files from 3.0.
+_SAVEFIG_BACKEND = _MPL_VERSION >= (3, 1)
+_SAVEFIG_METADATA = _MPL_VERSION >= (3, 0)
+
+
+def count_vertices(artist):
+    """
+    Return the number of vertices drawn by a line or collection artist.
+
+    For collections this is the larger of the number of offsets (i.e.
+    scatter points) and the total number of vertices in the paths.
+    """
+    if isinstance(artist, Line2D):
+        return len(artist.get_xydata())
+
+    if isinstance(artist, Collection):
+        nverts = sum(len(path.vertices) for path in artist.get_paths())
+        return max(len(artist.get_offsets()), nverts)
+
+    return 0
+
+
+@contextlib.contextmanager
+def rasterize_dense_artists(fig, threshold):
+    """
+    Rasterize the lines and collections in ``fig`` with more than
+    ``threshold`` vertices for the duration of the context.
+
+    Axes, text and artists already marked as rasterized are not changed.
+    """
+    dense = [artist for artist in
+             fig.findobj(lambda artist: isinstance(artist, (Line2D, Collection)))
+             if not artist.get_rasterized() and
+             count_vertices(artist) > threshold]
+
+    for artist in dense:
+        artist.set_rasterized(True)
+    try:
+        yield dense
+    finally:
+        for artist in dense:
+            artist.set_rasterized(False)
+
+
+def _savefig(fig, filename, backend=None, **kwargs):
+    """
+    Save ``fig`` with ``backend``, or the figure's own canvas if `None`.
+    """
+    if backend is None:
+        fig.savefig(filename, **kwargs)
+    elif _SAVEFIG_BACKEND:
+        fig.savefig(filename, backend=backend, **kwargs)
+    else:
+        module = importlib.import_module('matplotlib.backends.backend_' +
+                                         backend.lower())
+        canvas = fig.canvas
+        module.FigureCanvas(fig)
+        try:
+            fig.savefig(filename, **kwargs)
+        finally:
+            fig.set_canvas(canvas)
+
+
+def deterministic_environment(epoch=0):
+    """
+    Set the environment variables which make matplotlib and LaTeX write
+    reproducible files.
+
+    ``SOURCE_DATE_EPOCH`` is set to ``epoch``, unless it is already set,
+    and is used as the creation date by matplotlib's PDF, PostScript and SVG
+    backends. ``FORCE_SOURCE_DATE=1`` makes pdfTeX use it too, for the PDF
+    files compiled through the pgf backend.
+    """
+    os.environ.setdefault('SOURCE_DATE_EPOCH', str(int(epoch)))
+    os.environ.setdefault('FORCE_SOURCE_DATE', '1')
+
+
+def save_mpl_figure(fig, filename, rasterize_threshold=None, backends=None,
+                    decimate=None, deterministic=False, **kwargs):
+    """
+    Save a matplotlib figure object to a file.
+
+    Parameters
+    ----------
+
+    fig : `matplotlib.figure.Figure`
+        The figure to save.
+
+    filename : `str`
+        The file name to save to.
+
+    rasterize_threshold : `int`
+        When saving to a vector format, rasterize lines and collections with
+        more than this many vertices, see
+        `~texfigure.render.rasterize_dense_artists`.
+
+    backends : `dict`
+        A mapping of file extensions to the matplotlib backend to save them
+        with, such as `~texfigure.render.RASTER_BACKENDS`. Other extensions
+        are saved with the figure's current backend.
+
+    decimate : `str`
+        Reduce long lines to the resolution of the saved figure with the
+        ``'minmax'`` or ``'lttb'`` method before saving, see
+        `~texfigure.decimate.decimate_lines`. The resolution is the ``dpi``
+        in ``kwargs`` or ``savefig.dpi``.
+
+    deterministic : `bool`
+        Write the same bytes every time the same figure is saved, by leaving
+        out the creation date metadata and using a fixed salt for the ids
+        in SVG files. Use with `~texfigure.render.deterministic_environment`
+        for PostScript files and PDF files compiled by LaTeX.
+
+    kwargs : `dict`
+        Passed to `~matplotlib.figure.Figure.savefig`.
+    """
+
+    ext = os.path.splitext(filename)[1].lower()
+    backend = backends.get(ext) if backends else None
+
+    rc = {}
+    if deterministic:
+        if _SAVEFIG_METADATA and ext in VOLATILE_METADATA:
+            metadata = dict(VOLATILE_METADATA[ext])
+            metadata.update(kwargs.get('metadata') or {})
+            kwargs['metadata'] = metadata
+        if 'svg.hashsalt' in matplotlib.rcParams:
+            rc['svg.hashsalt'] = SVG_HASHSALT
+
+    with matplotlib.rc_context(rc), \
+            decimate_lines(fig, decimate, dpi=kwargs.get('dpi')):
+        if rasterize_threshold is not None and ext in VECTOR_FORMATS:
+            with rasterize_dense_artists(fig, rasterize_threshold):
+                _savefig(fig, filename, backend, **kwargs)
+        else:
+            _savefig(fig, filename, backend, **kwargs)
+
+    return filename
+
+
+def _render_pickled(save_function, data, filename, kwargs, rc):
+    """
+    Unpickle a figure and save it, this is run in the worker processes.
+
+    Returns the saved file name and the time taken to save it.
+    """
+    fig = pickle.loads(data)
+    try:
+        with matplotlib.rc_context(rc):
+            start = default_timer()
+            filename = save_function(fig, filename, **kwargs)
+            return filename, default_timer() - start
+    finally:
+        # Figures pickled from pyplot are registered with pyplot again when
+        # they are unpickled, and would be kept alive by the worker.
+        import matplotlib.pyplot as plt
+        plt.close(fig)
+
+
+class RenderQueue(object):
+    """
+    A queue of figures being rendered by a pool of worker processes.
+
+    Figures are pickled when they are submitted, so they can be modified or
+    closed as soon as `~texfigure.render.RenderQueue.submit` returns.
+
+    Parameters
+    ----------
+
+    processes : `int`
+        The number of worker processes, if `None` one per CPU is used.
+    """
+
+    def __init__(self, processes=None):
+        self.processes = processes
+        self._executor = None
+        self._pending = []
+
+    def submit(self, save_function, data, filename, kwargs, on_done=None):
+        """
+        Render a pickled figure in a worker process.
+
+        Parameters
+        ----------
+
+        save_function : callable
+            A module level save function, called as
+            ``save_function(fig, filename, **kwargs)``.
+
+        data : `bytes`
+            The pickled figure.
+
+        filename : `str`
+            The file name to save the figure to.
+
+        kwargs : `dict`
+            Keyword arguments for ``save_function``.
+
+        on_done : callable
+            Called with the saved file name and the time in seconds the
+            worker spent saving it, when the render has finished and the
+            queue is flushed.
+        """
+        if self._executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+            self._executor = ProcessPoolExecutor(self.processes)
+
+        rc = dict((key, value) for key, value in matplotlib.rcParams.items()
+                  if not key.startswith('backend'))
+
+        future = self._executor.submit(_render_pickled, save_function, data,
+                                       filename, kwargs, rc)
+        self._pending.append((filename, future, on_done))
+
+        return future
+
+    def __len__(self):
+        return len(self._pending)
+
+    def flush(self):
+        """
+        Wait for all submitted renders to finish.
+
+        Raises
+        ------
+
+        RuntimeError
+            If any of the renders failed, listing all the failures.
+        """
+        pending, self._pending = self._pending, []
+
+        errors = []
+        for filename, future, on_done in pending:
+            try:
+                saved, seconds = future.result()
+            except Exception as err:
+                errors.append("{}: {!r}".format(os.path.basename(filename),
+                                                err))
+                continue
+            if on_done is not None:
+                on_done(saved, seconds)
+
+        if errors:
+            raise RuntimeError("{} figure(s) failed to render:\n{}".format(
+                len(errors), '\n'.join(errors)))
+
+    def shutdown(self):
+        """
+        Stop the worker processes, waiting for any outstanding renders.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
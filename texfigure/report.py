@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Recording of the time spent and files written saving each figure.
+"""
+from __future__ import print_function
+import os
+import json
+from collections import OrderedDict
+
+__all__ = ['BuildReport']
+
+
+class BuildReport(object):
+    """
+    A record of the cost of each figure saved by a `~texfigure.Manager`.
+
+    For every figure reference this holds the time spent in the save
+    function for each file, the time spent creating and registering the
+    `~texfigure.Figure` object, and the format and size of each output file.
+    """
+
+    def __init__(self):
+        self._records = OrderedDict()
+
+    def _record(self, ref):
+        if ref not in self._records:
+            self._records[ref] = {'ref': ref, 'files': [], 'figure_time': 0.}
+        return self._records[ref]
+
+    def add_save(self, ref, filename, seconds, cached=False, background=False):
+        """
+        Record the saving of one file for ``ref``.
+
+        Parameters
+        ----------
+
+        ref : `str`
+            The figure reference.
+
+        filename : `str`
+            The saved file.
+
+        seconds : `float`
+            The time spent in the save function, for background renders this
+            is the time spent in the worker process.
+
+        cached : `bool`
+            `True` if the file was restored from the render cache.
+
+        background : `bool`
+            `True` if the file was rendered in a worker process.
+        """
+        files = self._record(ref)['files']
+        for entry in files:
+            if entry['filename'] == filename:
+                entry.update(save_time=seconds, cached=cached,
+                             background=background)
+                return
+
+        files.append({'filename': filename,
+                      'format': os.path.splitext(filename)[1].lstrip('.'),
+                      'save_time': seconds,
+                      'cached': cached,
+                      'background': background})
+
+    def add_figure_time(self, ref, seconds):
+        """
+        Record the time spent creating and registering the
+        `~texfigure.Figure` object for ``ref``.
+        """
+        self._record(ref)['figure_time'] += seconds
+
+    def records(self):
+        """
+        Return the records for each figure, most expensive first.
+
+        Returns
+        -------
+
+        records : `list`
+            A `dict` for each figure, with the keys ``ref``, ``files`` (a
+            `list` of `dict` for each file with ``filename``, ``format``,
+            ``size``, ``save_time``, ``cached`` and ``background`` keys),
+            ``save_time``, ``figure_time``, ``total_time`` and ``size``.
+        """
+        records = []
+        for record in self._records.values():
+            files = []
+            for entry in record['files']:
+                entry = dict(entry)
+                try:
+                    entry['size'] = os.path.getsize(entry['filename'])
+                except OSError:
+                    entry['size'] = None
+                files.append(entry)
+
+            save_time = sum(entry['save_time'] for entry in files)
+            records.append({'ref': record['ref'],
+                            'files': files,
+                            'save_time': save_time,
+                            'figure_time': record['figure_time'],
+                            'total_time': save_time + record['figure_time'],
+                            'size': sum(entry['size'] or 0 for entry in files)})
+
+        return sorted(records, key=lambda record: record['total_time'],
+                      reverse=True)
+
+    def write(self, filename):
+        """
+        Write the records to a JSON file.
+        """
+        with open(filename, 'w') as fobj:
+            json.dump(self.records(), fobj, indent=1)
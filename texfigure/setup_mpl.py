@@ -13,6 +13,9 @@ import numpy as np
 import matplotlib
 matplotlib.use('pgf')
 
+from .latex import (keep_latex_managers, warm_latex_manager, use_format,
+                    cache_text_metrics)
+
 
 def figsize(pytex, scale=None, height_ratio=None, figure_width_context="figurewidth"):
     r"""
@@ -85,7 +88,8 @@ def figsize(pytex, scale=None, height_ratio=None, figure_width_context="figurewi
     return (fig_width, fig_width*height_ratio)
 
 
-def configure_latex_plots(pytex, font_size=12, **kwargs):
+def configure_latex_plots(pytex, font_size=12, warm_latex=False, format_dir=None,
+                          text_metrics=None, keep_latex=False, **kwargs):
     """
     Configure a sane set of latex defaults for pgf figure generation.
 
@@ -104,6 +108,27 @@ def configure_latex_plots(pytex, font_size=12, **kwargs):
         | ytick.labelsize
         | legend.fontsize
 
+    warm_latex : `bool`
+        Start the LaTeX process for this configuration in the background
+        straight away, rather than when the first figure is saved.
+
+    format_dir : `str`
+        If given, the pgf preamble is precompiled into a LaTeX format file
+        cached in this directory, so LaTeX does not parse the preamble each
+        time it starts, see `texfigure.latex.use_format`. This needs the
+        ``mylatexformat`` LaTeX package.
+
+    text_metrics : `str`
+        If given, the sizes LaTeX reports for each piece of text are cached
+        in this JSON file and reused in later builds, see
+        `texfigure.latex.cache_text_metrics`.
+
+    keep_latex : `bool`
+        Keep the LaTeX process matplotlib uses to measure text running for
+        each preamble used during the session, rather than only for the
+        most recent one, see `texfigure.latex.keep_latex_managers`. This is
+        also done if ``warm_latex`` is set.
+
     kwargs : `dict`
         Extra keyword arguments are used to update `matplotlib.rcParams`.
     """
@@ -129,6 +154,15 @@ def configure_latex_plots(pytex, font_size=12, **kwargs):
     pgf_with_latex.update(kwargs)
     matplotlib.rcParams.update(pgf_with_latex)
 
+    if format_dir is not None:
+        use_format(format_dir)
+    if text_metrics is not None:
+        cache_text_metrics(text_metrics)
+    if keep_latex:
+        keep_latex_managers()
+    if warm_latex:
+        warm_latex_manager()
+
 
 
 def preamble_setup():
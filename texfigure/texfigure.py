@@ -1,9 +1,14 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function
+import io
 import os
 import sys
-import glob
-from collections import OrderedDict, Sequence
+import atexit
+import weakref
+import hashlib
+import functools
+from timeit import default_timer
+from collections import Sequence
 import six
 
 import numpy as np
@@ -11,23 +16,71 @@ import numpy as np
 import matplotlib
 import matplotlib.pyplot as plt
 
-try:
-    import mayavi
-    from mayavi import mlab
-    HAVE_MAYAVI = True
-except ImportError:
-    HAVE_MAYAVI = False
-
-try:
-    import yt
-    HAVE_YT = True
-except ImportError:
-    HAVE_YT = False
+from .cache import RenderCache, figure_fingerprint, pickle_figure
+from .dependencies import DependencyGraph, FigureScope, block_source
+from .registry import FigureRegistry
+from .data import DirectoryIndex, load_data, iter_chunks
+from .report import BuildReport
+from .render import (RenderQueue, save_mpl_figure, RASTER_BACKENDS,
+                     deterministic_environment)
+from .externalize import (compile_pgf, compile_pgf_pages, can_split_pages,
+                          external_filename)
+from .output import save_if_changed
 
 
 __all__ = ['Manager', 'Figure', 'MultiFigure']
 
 
+SAVER_ENTRY_POINT_GROUP = 'texfigure.savers'
+
+_entry_point_savers = None
+
+
+def _saver_entry_points():
+    """
+    Return a `dict` mapping qualified type names to the (unloaded) entry
+    points registered in the ``texfigure.savers`` group.
+
+    The installed distributions are only scanned once per session.
+    """
+    global _entry_point_savers
+
+    if _entry_point_savers is None:
+        _entry_point_savers = {}
+        for entry_point in _iter_entry_points(SAVER_ENTRY_POINT_GROUP):
+            _entry_point_savers.setdefault(entry_point.name, entry_point)
+
+    return _entry_point_savers
+
+
+def _iter_entry_points(group):
+    """
+    Return the entry points in ``group`` from `importlib.metadata`, or from
+    ``pkg_resources`` on Python versions without it.
+    """
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        try:
+            import pkg_resources
+        except ImportError:
+            return []
+        return list(pkg_resources.iter_entry_points(group))
+
+    all_entry_points = entry_points()
+    if hasattr(all_entry_points, 'select'):
+        return list(all_entry_points.select(group=group))
+    # Before Python 3.10 entry_points returns a dict keyed by group.
+    return list(all_entry_points.get(group, []))
+
+
+def _type_name(atype):
+    """
+    The fully qualified name of a type, i.e. ``matplotlib.figure.Figure``.
+    """
+    return '{}.{}'.format(atype.__module__, atype.__name__)
+
+
 class Figure(object):
     r"""
     A class for holding a figure file, that knows how to represent itself
@@ -47,10 +100,12 @@ class Figure(object):
     Attributes
     ----------
     fname : `str`
-        The base name of the full file path
+        The base name of the full file path, setting it changes
+        ``file_name``.
 
     base_dir : `str`
-        The directory containing the figure file
+        The directory containing the figure file, setting it changes
+        ``file_name``.
 
     caption : `str`
         The caption to use when representing the figure.
@@ -78,9 +133,23 @@ class Figure(object):
     subfig_placement : `str`
         The subfigure environment placement. (Default ``b``)
 
+    external_file : `str`
+        For ``.pgf`` figures, a PDF compiled from the ``.pgf`` file which is
+        included instead of importing the ``.pgf`` file, once it exists.
+        (Default `None`)
+
+    external_page : `int`
+        The page of ``external_file`` containing this figure, when several
+        figures are compiled to one PDF. (Default `None`, the whole file)
+
+    extension_includes : `dict`
+        A class level mapping of file extensions to the names of the methods
+        which return LaTeX includes for the file type.
+
     extension_mapping : `dict`
         A mapping of file extensions to methods to return LaTeX includes for
-        the file type.
+        the file type. This is only created for an instance when it is
+        accessed, otherwise ``extension_includes`` is used.
 
     fig_str : `str`
         The LaTeX template for representing this `~texfigure.Figure` as
@@ -125,48 +194,145 @@ class Figure(object):
         \label{{{label}}}
     \end{{subfigure}}"""
 
+    # Methods returning the LaTeX include for each file extension, shared by
+    # all instances unless extension_mapping is used.
+    extension_includes = {'.pgf': 'get_pgf_include',
+                          '.png': 'get_standard_include',
+                          '.pdf': 'get_standard_include'}
+
+    __slots__ = ('file_name', 'reference', '_caption', '_label', 'placement',
+                 'figure_env_name', 'figure_width', 'subfig_width',
+                 'subfig_placement', 'external_file', 'external_page',
+                 '_extension_mapping')
+
     def __init__(self, file_name, reference=None):
         file_name = os.path.abspath(file_name)
         if not reference:
-            self.reference = os.path.splitext(os.path.basename(file_name))[1]
-        else:
-            self.reference = reference
-
-        self.reference = self.reference.replace('_', '-')
+            reference = os.path.splitext(os.path.basename(file_name))[1]
 
+        self.reference = reference.replace('_', '-')
         self.file_name = file_name
-        self.fname = os.path.basename(file_name)
-        self.base_dir = os.path.dirname(file_name) + '/'
 
-        self.caption = "Figure {}".format(self.reference)
-        self.label = "fig:{}".format(self.reference)
+        self._caption = None
+        self._label = None
         self.placement = 'h'
         self.figure_env_name = "figure"
         self.figure_width = r'0.95\columnwidth'
         self.subfig_width = r'0.45\columnwidth'
         self.subfig_placement = 'b'
+        self.external_file = None
+        self.external_page = None
+
+        self._extension_mapping = None
+
+    @property
+    def fname(self):
+        """
+        The base name of the full file path.
+        """
+        return os.path.basename(self.file_name)
 
-        self.extension_mapping = {'.pgf': self.get_pgf_include,
-                                  '.png': self.get_standard_include,
-                                  '.pdf': self.get_standard_include}
+    @fname.setter
+    def fname(self, value):
+        self.file_name = os.path.join(os.path.dirname(self.file_name), value)
+
+    @property
+    def base_dir(self):
+        """
+        The directory containing the figure file.
+        """
+        return os.path.dirname(self.file_name) + '/'
+
+    @base_dir.setter
+    def base_dir(self, value):
+        self.file_name = os.path.join(value, self.fname)
+
+    @property
+    def caption(self):
+        """
+        The caption to use when representing the figure.
+        """
+        if self._caption is None:
+            return "Figure {}".format(self.reference)
+        return self._caption
+
+    @caption.setter
+    def caption(self, value):
+        self._caption = value
+
+    @property
+    def label(self):
+        """
+        The latex label assigned to the figure environment.
+        """
+        if self._label is None:
+            return "fig:{}".format(self.reference)
+        return self._label
+
+    @label.setter
+    def label(self, value):
+        self._label = value
+
+    @property
+    def extension_mapping(self):
+        """
+        A mapping of file extensions to methods to return LaTeX includes for
+        the file type.
+
+        By default all figures share the class level ``extension_includes``,
+        accessing this attribute gives the figure its own copy which can be
+        modified.
+        """
+        if self._extension_mapping is None:
+            self._extension_mapping = dict(
+                (ext, getattr(self, name))
+                for ext, name in self.extension_includes.items())
+        return self._extension_mapping
+
+    @extension_mapping.setter
+    def extension_mapping(self, value):
+        self._extension_mapping = value
 
     @property
     def extension(self):
         """
         File extension of fname.
         """
-        return os.path.splitext(self.fname)[1]
+        return os.path.splitext(self.file_name)[1]
+
+    def get_include(self):
+        """
+        Return the LaTeX include for the figure file, based on its
+        extension.
+        """
+        if self._extension_mapping is not None:
+            return self._extension_mapping[self.extension]()
+        return getattr(self, self.extension_includes[self.extension])()
 
     def get_pgf_include(self):
         """
         Return the import statement for this `~texfigure.Figure` as
-        a pgf file.close.
+        a pgf file.
+
+        If ``external_file`` is set the compiled PDF, or its
+        ``external_page``, is included when it exists, rather than importing
+        the pgf file.
         """
 
-        return r"\IfFileExists{{{file_name}}}{{\import{{{base_dir}}}{{{fname}}}}}{{}}".format(
+        include = r"\IfFileExists{{{file_name}}}{{\import{{{base_dir}}}{{{fname}}}}}{{}}".format(
                                                       fname=self.fname,
                                                       base_dir=self.base_dir,
                                                       file_name=self.file_name)
+        if self.external_file:
+            options = ''
+            if self.external_page:
+                options = '[page={}]'.format(self.external_page)
+            include = r"\IfFileExists{{{external}}}{{\includegraphics{options}{{{external}}}}}{{{include}}}".format(
+                                                      external=self.external_file,
+                                                      options=options,
+                                                      include=include)
+
+        return include
 
     def get_standard_include(self):
         """
@@ -187,7 +353,7 @@ class Figure(object):
                           'label': self.label,
                           'figure_env_name': self.figure_env_name}
 
-        myfig = self.extension_mapping[self.extension]()
+        myfig = self.get_include()
 
         return self.fig_str.format(myfig=myfig, **default_kwargs)
 
@@ -200,7 +366,7 @@ class Figure(object):
                           'caption': self.caption,
                           'label': self.label}
 
-        myfig = self.extension_mapping[self.extension]()
+        myfig = self.get_include()
 
         return self.subfig_str.format(myfig=myfig, **default_kwargs)
 
@@ -289,18 +455,49 @@ class MultiFigure(Sequence):
         if continuation:
             self.frontmatter += '\n' + r'\ContinuedFloat'
 
-        self.figures = np.zeros([nrows, ncols], dtype=object)
-        self.figures[:] = None
+        self.figures = np.empty([nrows, ncols], dtype=object)
+
+    @property
+    def figures(self):
+        """
+        Array holding `texfigure.Figure` objects, has a shape of
+        (nrows, ncols).
+        """
+        return self._figures
+
+    @figures.setter
+    def figures(self, value):
+        self._figures = value
+        # Index of the first slot which may be empty.
+        self._cursor = 0
 
     def __len__(self):
-        return self.figures.size()
+        return self.figures.size
+
+    def _next_slot(self):
+        """
+        Return the flat index of the next empty slot.
+
+        Slots before the cursor are known to be filled, so filling the grid
+        by appending only visits each slot once.
+        """
+        flat = self.figures.flat
+        size = self.figures.size
+        while self._cursor < size and flat[self._cursor] is not None:
+            self._cursor += 1
+
+        if self._cursor == size:
+            raise ValueError("This MultiFigure is full")
+
+        return self._cursor
 
-# TODO: This is not really felxible enough. It dosen't work when ncols > 1.
-# It should probably be a method which can split it into x vertical chunks.
     def __getitem__(self, key):
         """
         Return a continuation when indexed, unless indexed for a single figure,
         when we return the `texfigure.Figure` instance.
+
+        Slices select rows of the grid. To split a `~texfigure.MultiFigure`
+        into several continued figures use `~texfigure.MultiFigure.split`.
         """
         if isinstance(key, int):
             return self.figures.flat[key]
@@ -320,7 +517,7 @@ class MultiFigure(Sequence):
             new_mf.figures = new_figures
 
             # If we are at the end then add the caption
-            if key.stop is None or key.stop == self.figures.size:
+            if key.stop is None or key.stop >= self.nrows:
                 new_mf.caption = self.caption
             else:
                 new_mf.caption = ''
@@ -338,12 +535,38 @@ class MultiFigure(Sequence):
             raise TypeError("Only texfigure.Figures can be"
                             " appended to a MultiFigure")
 
-        empties = np.logical_not(self.figures.flat).nonzero()[0]
+        self.figures.flat[self._next_slot()] = figure
+
+    def extend(self, figures):
+        """
+        Add a sequence of `texfigure.Figure` objects to the next empty slots
+        in the `~texfigure.MultiFigure`.
+
+        Either all the figures are added, or, if any of them is not a
+        `texfigure.Figure` or there are not enough empty slots, none are.
+        """
+        figures = list(figures)
+        if not all(isinstance(figure, Figure) for figure in figures):
+            raise TypeError("Only texfigure.Figures can be"
+                            " appended to a MultiFigure")
+
+        if not figures:
+            return
 
-        if len(empties):
-            self.figures.flat[empties[0]] = figure
+        flat = self.figures.flat
+        empties = []
+        for i in range(self._cursor, self.figures.size):
+            if flat[i] is None:
+                empties.append(i)
+                if len(empties) == len(figures):
+                    break
         else:
-            raise ValueError("This MultiFigure is full")
+            raise ValueError("This MultiFigure does not have space for {} more"
+                             " figures".format(len(figures)))
+
+        for i, figure in zip(empties, figures):
+            flat[i] = figure
+        self._cursor = empties[-1] + 1
 
     def _repr_latex_(self):
         default_kwargs = {'placement': self.placement,
@@ -351,15 +574,104 @@ class MultiFigure(Sequence):
                           'label': self.label,
                           'frontmatter': self.frontmatter}
 
-        subfigures = ""
+        subfigures = []
 
         for i, fig in enumerate(self.figures.flat):
-            if fig:
+            if fig is not None:
                 if i % self.ncols == 0:
-                    subfigures += '\n'
-                subfigures += fig.repr_subfigure()
+                    subfigures.append('\n')
+                subfigures.append(fig.repr_subfigure())
+
+        return self.fig_str.format(myfig=''.join(subfigures), **default_kwargs)
+
+    def split(self, nrows):
+        """
+        Split this `~texfigure.MultiFigure` into chunks of rows, for figures
+        which are too large to fit on one page.
+
+        All but the first chunk are continuations, using ``\\ContinuedFloat``
+        so they share a figure number, and only the last chunk has the
+        caption.
+
+        Parameters
+        ----------
+
+        nrows : `int`
+            The maximum number of rows in each chunk.
+
+        Yields
+        ------
+
+        chunk : `texfigure.MultiFigure`
+            Each chunk in turn.
+        """
+        if nrows < 1:
+            raise ValueError("nrows must be at least 1.")
+
+        for i, start in enumerate(range(0, self.nrows, nrows)):
+            rows = self.figures[start:start + nrows]
+            continuation = i > 0
+
+            chunk = MultiFigure(rows.shape[0], self.ncols,
+                                reference=self.reference,
+                                continuation=continuation)
+            chunk.figures = rows
+            chunk.placement = self.placement
+            chunk.frontmatter = self.frontmatter
+            chunk.label = self.label
+            if continuation:
+                chunk.frontmatter += '\n' + r'\ContinuedFloat'
+                chunk.label = '{}-c{}'.format(self.label, i)
+            chunk.caption = self.caption if start + nrows >= self.nrows else ''
+
+            yield chunk
+
+    def iter_latex(self, nrows=None):
+        """
+        Yield the LaTeX for this `~texfigure.MultiFigure` one figure
+        environment at a time.
+
+        Parameters
+        ----------
+
+        nrows : `int`
+            If given, split the figure into continued figures of at most
+            this many rows, see `~texfigure.MultiFigure.split`.
+        """
+        if nrows is None:
+            yield self._repr_latex_()
+            return
 
-        return self.fig_str.format(myfig=subfigures, **default_kwargs)
+        for chunk in self.split(nrows):
+            yield chunk._repr_latex_()
+
+    def write_latex(self, fobj, nrows=None):
+        """
+        Write the LaTeX for this `~texfigure.MultiFigure` to an open file,
+        one figure environment at a time.
+
+        Parameters
+        ----------
+
+        fobj : file
+            The file object to write to.
+
+        nrows : `int`
+            If given, split the figure into continued figures of at most
+            this many rows, see `~texfigure.MultiFigure.split`.
+        """
+        for latex in self.iter_latex(nrows):
+            fobj.write(latex)
+
+
+def _end_session(manager_ref):
+    """
+    Finish the session of a `~texfigure.Manager` at exit, if it is still
+    alive. Only a weak reference is held so the manager can be collected.
+    """
+    manager = manager_ref()
+    if manager is not None:
+        manager._session_end()
 
 
 class Manager(object):
@@ -393,20 +705,119 @@ class Manager(object):
         Path to a directory containing generated figures. Overrides
         ``base_path/Figs``
 
+    cache_dir : `bool` or `str`
+        Path to a directory used to cache rendered figures, the data
+        dependencies of each `~texfigure.Manager.figure` scope and the figure
+        registry between runs. If `True` ``base_path/Cache`` is used, if
+        `False` (the default) figures are always rendered and the registry is
+        lost at the end of the session.
+
+    processes : `int` or `bool`
+        If set, matplotlib figures are pickled and rendered in the background
+        by a pool of this many worker processes (one per CPU if `True`),
+        `~texfigure.Manager.save_figure` returns as soon as the figure has
+        been queued. Call `~texfigure.Manager.flush` or use the manager as a
+        context manager to wait for the renders to finish.
+
+    rasterize_threshold : `int`
+        If set, lines and collections in matplotlib figures with more vertices
+        than this are rasterized when saving to vector formats, such as
+        ``.pgf`` and ``.pdf``, while axes and text are kept as vectors.
+
+    decimate : `str`
+        If set, lines in matplotlib figures with more points than can be
+        resolved are reduced to two points per pixel of the width of their
+        axes before saving, at the ``dpi`` given to
+        `~texfigure.Manager.save_figure` or ``savefig.dpi``. ``'minmax'``
+        keeps the minimum and maximum of the line in each pixel, so the
+        envelope of noisy data is preserved, ``'lttb'`` uses the Largest
+        Triangle Three Buckets algorithm, which better preserves the shape of
+        smooth lines. See `texfigure.decimate.decimate_lines`.
+
+    deterministic : `bool`
+        If `True`, files are written so that saving the same figure always
+        produces the same bytes, see `~texfigure.Manager.deterministic`.
+
+    externalize : `bool`
+        If `True`, ``.pgf`` figures are compiled to standalone PDF files
+        when the manager is flushed, and the `~texfigure.Figure` objects
+        include the PDF rather than importing the ``.pgf`` file, so the plot
+        code is not typeset on every pass of the main document. All the
+        figures which have changed are compiled in a single LaTeX run, see
+        `texfigure.externalize.compile_pgf`, and when there is a
+        ``cache_dir`` the compiled PDFs are cached by a hash of their
+        content. If neither pypdf nor PyPDF2 is installed, the figures
+        queued for each flush are compiled to the pages of one PDF and
+        included by page, see `texfigure.externalize.compile_pgf_pages`.
+
 
     Attributes
     ----------
 
-    savefig_functions : `dict`
+    rasterize_threshold : `int` or `None`
+        The vertex count above which matplotlib artists are rasterized in
+        vector output, see the ``rasterize_threshold`` parameter. It can also
+        be passed to `~texfigure.Manager.save_figure` for a single figure.
+
+    decimate : `str` or `None`
+        The method used to decimate long lines, see the ``decimate``
+        parameter. It can also be passed to `~texfigure.Manager.save_figure`
+        for a single figure.
+
+    filename_template : `str`
+        The template for the default figure file names, formatted with the
+        manager ``number``, the figure ``ref``, the file extension ``fext``
+        and the ``count`` of figures saved so far. The default,
+        ``'Chapter{number}-{ref}{fext}'``, only depends on the reference, so
+        adding or removing a figure does not rename the files of the figures
+        after it. ``'Chapter{number}-Figure{count}-{ref}{fext}'`` gives the
+        file names used by earlier versions of texfigure.
+
+    extension_backends : `dict`
+        A mapping of file extensions to the matplotlib backend used to save
+        matplotlib figures in that format, regardless of the backend in use.
+        By default raster formats, such as ``.png``, are rendered with Agg
+        rather than through LaTeX by the pgf backend; Agg still uses LaTeX
+        for text if ``text.usetex`` is set. Other extensions use the current
+        backend.
+
+    data_index : `texfigure.data.DirectoryIndex`
+        The index of the files in ``data_dir`` used by
+        `~texfigure.Manager.data_file`. Call ``data_index.refresh()`` to
+        force the directory to be rescanned.
+
+    savefigure_functions : `dict`
         A mapping between figure types and functions to save them to a given
         filename. Functions in the mapping must accept two arguments, the
         figure object and a filename, the function must return the filename
-        as saved to disk.
+        as saved to disk. Keys can either be types, or the fully qualified
+        name of a type (i.e. ``'mayavi.core.scene.Scene'``) so that the
+        module defining the type does not have to be imported until a figure
+        of that type is saved. Use
+        `~texfigure.Manager.register_save_function` to add to this mapping
+        after figures have been saved.
+
+    Notes
+    -----
+
+    Other packages can provide save functions for their figure types by
+    registering them as entry points in the ``texfigure.savers`` group, with
+    the entry point name being the fully qualified name of the figure type::
+
+        entry_points={'texfigure.savers':
+                      ['mypkg.plots.MyPlot = mypkg.texfigure:save_myplot']}
+
+    Entry points are only looked up, and loaded, when a figure of a type not
+    in ``savefigure_functions`` is saved.
 
     """
 
+    filename_template = 'Chapter{number}-{ref}{fext}'
+
     def __init__(self, pytex, base_path, number=1, python_dir=True,
-                 data_dir=True, fig_dir=True):
+                 data_dir=True, fig_dir=True, cache_dir=False,
+                 processes=None, rasterize_threshold=None, decimate=None,
+                 deterministic=False, externalize=False):
 
         self.pytex = pytex
         self._number = number
@@ -416,22 +827,45 @@ class Manager(object):
         self.python_dir = python_dir
 
         self._data_dir = None
+        self.data_index = None
         self.data_dir = data_dir
 
         self._fig_dir = None
         self.fig_dir = fig_dir
 
-        self.fig_count = 1
-        self._figure_registry = OrderedDict()
+        self._touched_files = []
+        self._active_scope = None
 
-        self.savefigure_functions = {matplotlib.figure.Figure:
-                                     self._save_mpl_figure}
+        self._cache_dir = None
+        self._render_cache = None
+        self._dependency_graph = DependencyGraph()
+        self._figure_registry = FigureRegistry(manager_number=number)
+        self.cache_dir = cache_dir
 
-        if HAVE_MAYAVI:
-            self.savefigure_functions[mayavi.core.scene.Scene] = self._save_mayavi_figure
+        self._render_queue = None
+        if processes:
+            self._render_queue = RenderQueue(None if processes is True
+                                             else processes)
 
-        if HAVE_YT:
-            self.savefigure_functions[yt.visualization.plot_container.ImagePlotContainer] = self._save_yt_ipc
+        self.rasterize_threshold = rasterize_threshold
+        self.extension_backends = dict(RASTER_BACKENDS)
+        self.decimate = decimate
+        self.deterministic = deterministic
+
+        self.externalize = externalize
+        self._external_pending = []
+        self._external_batches = 0
+
+        self._build_report = BuildReport()
+        atexit.register(_end_session, weakref.ref(self))
+
+        self.fig_count = 1
+
+        self.savefigure_functions = {
+            matplotlib.figure.Figure: self._save_mpl_figure,
+            'mayavi.core.scene.Scene': self._save_mayavi_figure,
+            'yt.visualization.plot_container.ImagePlotContainer': self._save_yt_ipc}
+        self._save_function_cache = {}
 
     def _add_dir(self, adir, attr, default):
         if adir:
@@ -457,6 +891,8 @@ class Manager(object):
     @data_dir.setter
     def data_dir(self, value):
         self._add_dir(value, '_data_dir', 'Data')
+        if self._data_dir:
+            self.data_index = DirectoryIndex(self._data_dir)
 
     @property
     def fig_dir(self):
@@ -473,6 +909,47 @@ class Manager(object):
     def fig_dir(self, value):
         self._add_dir(value, '_fig_dir', 'Figs')
 
+    @property
+    def cache_dir(self):
+        """
+        Cache directory for rendered figures.
+
+        If cache_dir is set to False no cache will be used, if set to True
+        the default directory of ``manager.base_path/Cache`` will be used, if
+        cache_dir is set to a `str` then that dir will be used.
+
+        When a cache is used, saving a figure which is identical to one saved
+        previously, with the same keyword arguments, extension and
+        ``rcParams``, copies the cached file rather than rendering it again.
+        The data files used by each figure are also recorded here, see
+        `~texfigure.Manager.figure`, as is the figure registry, so figures
+        saved in one PythonTeX session can be retrieved with
+        `~texfigure.Manager.get_figure` in another.
+        """
+        return self._cache_dir
+
+    @cache_dir.setter
+    def cache_dir(self, value):
+        self._add_dir(value, '_cache_dir', 'Cache')
+        if value and self._cache_dir:
+            self._render_cache = RenderCache(self._cache_dir)
+            self._dependency_graph = DependencyGraph(
+                os.path.join(self._cache_dir,
+                             'dependencies-{}.json'.format(self.number)))
+            registry = FigureRegistry(os.path.join(self._cache_dir,
+                                                   'registry.sqlite'),
+                                      manager_number=self.number)
+            atexit.register(registry.close)
+        else:
+            self._cache_dir = None
+            self._render_cache = None
+            self._dependency_graph = DependencyGraph()
+            registry = FigureRegistry(manager_number=self.number)
+
+        registry.update(self._figure_registry._entries)
+        self._figure_registry.close()
+        self._figure_registry = registry
+
     @property
     def python_dir(self):
         """
@@ -497,6 +974,28 @@ class Manager(object):
         if self._python_dir:
             sys.path.append(self._python_dir)
 
+    @property
+    def deterministic(self):
+        """
+        Write reproducible figure files.
+
+        When set, matplotlib figures are saved without creation dates in
+        their metadata and with a fixed salt for the ids in SVG files, and
+        the ``SOURCE_DATE_EPOCH`` (if it is not already set) and
+        ``FORCE_SOURCE_DATE`` environment variables are set, so that the
+        dates matplotlib writes to PostScript files, and LaTeX writes to PDF
+        files compiled through the pgf backend, are fixed. Identical figures
+        then produce identical files, which content hashing build tools and
+        caches can recognise.
+        """
+        return self._deterministic
+
+    @deterministic.setter
+    def deterministic(self, value):
+        self._deterministic = bool(value)
+        if self._deterministic:
+            deterministic_environment()
+
     @property
     def number(self):
         """
@@ -510,16 +1009,19 @@ class Manager(object):
         Get the full path of a data file in this chapters data directory,
         add it to the pytex tracked files.
 
+        Directory listings are cached in `~texfigure.Manager.data_index`, and
+        only re-read when the modification time of the directory changes.
+
         Parameters
         ----------
         file_name : `str`
-            The filename in the data directory
+            The filename, or glob pattern, in the data directory
         """
 
-        fpattern = os.path.join(self.data_dir, file_name)
-        fpaths = glob.glob(fpattern)
+        fpaths = self.data_index.find(file_name)
         for fpath in fpaths:
             self.pytex.add_dependencies(fpath)
+        self._touched_files.extend(fpaths)
 
         if not fpaths:
             raise ValueError("No files found matching this name or pattern.")
@@ -528,16 +1030,139 @@ class Manager(object):
         else:
             return fpaths
 
+    def load_data(self, file_name, mmap=True):
+        """
+        Load a ``.npy``, ``.npz`` or FITS file in this chapters data
+        directory, add it to the pytex tracked files.
+
+        By default the file is memory mapped, and the same mapping of a
+        ``.npy`` file is returned by every call for the file in this
+        session, so large arrays can be used from many code blocks without
+        being read repeatedly. ``.npz`` archives and FITS files are opened
+        by each call.
+
+        Parameters
+        ----------
+        file_name : `str`
+            The filename in the data directory
+
+        mmap : `bool`
+            Memory map the file, rather than reading it into memory.
+
+        Returns
+        -------
+        data : `numpy.ndarray`, `numpy.lib.npyio.NpzFile` or `astropy.io.fits.HDUList`
+            The data, see `texfigure.data.load_data`. Memory mapped arrays are
+            read-only.
+        """
+
+        fpath = self.data_file(file_name)
+        if not isinstance(fpath, six.string_types):
+            raise ValueError("{} matches more than one file.".format(file_name))
+
+        return load_data(fpath, mmap=mmap)
+
+    def iter_data(self, file_name, chunk_size=1000000, **kwargs):
+        """
+        Read a large data file in this chapters data directory in chunks of
+        rows, and add it to the pytex tracked files.
+
+        Parameters
+        ----------
+        file_name : `str`
+            The filename in the data directory, of a ``.npy``, HDF5 or text
+            file.
+
+        chunk_size : `int`
+            The number of rows in each chunk.
+
+        kwargs : `dict`
+            Passed to `texfigure.data.iter_chunks`, such as ``columns`` or
+            the HDF5 ``dataset``.
+
+        Returns
+        -------
+        chunks : iterator
+            The chunks of the file, as `numpy.ndarray`.
+        """
+
+        fpath = self.data_file(file_name)
+        if not isinstance(fpath, six.string_types):
+            raise ValueError("{} matches more than one file.".format(file_name))
+
+        return iter_chunks(fpath, chunk_size=chunk_size, **kwargs)
+
+    def aggregate_data(self, file_name, accumulator, columns=None,
+                       chunk_size=1000000, **kwargs):
+        """
+        Stream a large data file in this chapters data directory through an
+        accumulator, so it can be reduced with bounded memory.
+
+        Parameters
+        ----------
+        file_name : `str`
+            The filename in the data directory, of a ``.npy``, HDF5 or text
+            file.
+
+        accumulator : object
+            An object with an ``add`` method, such as
+            `texfigure.data.StreamingHistogram`,
+            `texfigure.data.StreamingHistogram2D` or
+            `texfigure.data.StreamingBinnedStatistic`.
+
+        columns : `list`
+            The columns of two dimensional data passed to ``add`` for each
+            chunk, in order. An item which is a list of columns is passed as
+            one array of coordinates. If `None` each chunk is passed as it
+            is.
+
+        chunk_size : `int`
+            The number of rows in each chunk.
+
+        kwargs : `dict`
+            Passed to `texfigure.data.iter_chunks`.
+
+        Returns
+        -------
+        accumulator : object
+            The accumulator, after all the data have been added.
+
+        Examples
+        --------
+
+        .. code-block:: python
+
+            hist = manager.aggregate_data(
+                'events.npy', StreamingHistogram2D(100, [(0, 1), (0, 1)]),
+                columns=[0, 1])
+            mean = manager.aggregate_data(
+                'events.npy', StreamingBinnedStatistic([50, 50],
+                                                       [(0, 1), (0, 1)]),
+                columns=[[0, 1], 2])
+        """
+
+        for chunk in self.iter_data(file_name, chunk_size=chunk_size,
+                                    **kwargs):
+            if columns is None:
+                accumulator.add(chunk)
+            else:
+                accumulator.add(*[chunk[:, column].T for column in columns])
+
+        return accumulator
+
     def make_figure_filename(self, ref, fname=None, fext='', fullpath=False):
         """
-        Return the standard template figure name with number.
+        Return the figure file name, from ``filename_template`` by default.
 
         Parameters
         ----------
         ref : `str`
             The latex reference for this figure (excluding 'fig:')
         fname : `str`
-            Overwrite the default file name template with this name.
+            Overwrite the default file name template with this name. If it
+            has no extension ``fext`` is appended.
+        fext : `str`
+            The file extension.
 
         Returns
         -------
@@ -545,23 +1170,234 @@ class Manager(object):
             The file name
         """
         if not fname:
-            fname = 'Chapter{}-Figure{}-{}{}'.format(self.number,
-                                                     self.fig_count,
-                                                     ref, fext)
+            fname = self.filename_template.format(number=self.number,
+                                                  count=self.fig_count,
+                                                  ref=ref, fext=fext)
+        elif not os.path.splitext(fname)[1]:
+            fname += fext
 
         if fullpath:
             fname = os.path.join(self.fig_dir, fname)
 
         return fname
 
+    def _render_figure(self, ref, save_function, fig, filenames, **kwargs):
+        """
+        Save ``fig`` to each of ``filenames`` using ``save_function``.
+
+        Each file is served from the render cache if an identical figure has
+        been saved before, or queued for a worker process if background
+        rendering is enabled. The figure is only fingerprinted, and pickled,
+        once for all the files. Existing files are only replaced if their
+        content has changed, so their modification times are kept. The time
+        taken for each file is added to the build report under ``ref``.
+
+        Returns
+        -------
+
+        filenames : `list`
+            The file names as saved to disk.
+        """
+        is_mpl = save_function == self._save_mpl_figure
+        if is_mpl:
+            kwargs = self._mpl_save_kwargs(kwargs)
+
+        background = self._render_queue is not None and is_mpl
+
+        fingerprint = None
+        if self._render_cache is not None:
+            fingerprint = figure_fingerprint(fig)
+
+        pickled = None
+        if background:
+            pickled = pickle_figure(fig)
+
+        saved = []
+        for filename in filenames:
+            start = default_timer()
+
+            key = None
+            if self._render_cache is not None and fingerprint is not None:
+                key = self._render_cache.key(fingerprint, filename, kwargs)
+                cached = self._render_cache.fetch(key, filename)
+                if cached:
+                    self._build_report.add_save(ref, cached,
+                                                default_timer() - start,
+                                                cached=True)
+                    saved.append(cached)
+                    continue
+
+            if pickled is not None:
+                on_done = functools.partial(self._background_done, ref, key)
+                save = functools.partial(save_if_changed, save_mpl_figure)
+                self._render_queue.submit(save, pickled, filename, kwargs,
+                                          on_done=on_done)
+                self._build_report.add_save(ref, filename, 0.,
+                                            background=True)
+                saved.append(filename)
+                continue
+
+            filename = save_if_changed(save_function, fig, filename, **kwargs)
+            self._build_report.add_save(ref, filename, default_timer() - start)
+
+            if key:
+                self._render_cache.store(key, filename)
+            saved.append(filename)
+
+        return saved
+
+    def _background_done(self, ref, key, filename, seconds):
+        """
+        Called when a figure rendered in the background has been saved.
+        """
+        self._build_report.add_save(ref, filename, seconds, background=True)
+        if key:
+            self._render_cache.store(key, filename)
+
+    def _mpl_save_kwargs(self, kwargs):
+        """
+        Add the manager wide matplotlib save options to ``kwargs``.
+        """
+        options = {}
+        if self.extension_backends:
+            options['backends'] = self.extension_backends
+        if self.rasterize_threshold is not None:
+            options['rasterize_threshold'] = self.rasterize_threshold
+        if self.decimate is not None:
+            options['decimate'] = self.decimate
+        if self.deterministic:
+            options['deterministic'] = True
+        options.update(kwargs)
+        return options
+
+    def _add_external(self, ref, Fig):
+        """
+        Queue a ``.pgf`` figure to be compiled to a PDF, and make ``Fig``
+        include the PDF.
+        """
+        if can_split_pages():
+            Fig.external_file = external_filename(Fig.file_name)
+            self.pytex.add_created(Fig.external_file)
+        else:
+            # The figures compiled in the next flush are the pages of one
+            # PDF, in the order they were queued.
+            Fig.external_file = self._external_batch_file()
+            Fig.external_page = len(self._external_pending) + 1
+            if Fig.external_page == 1:
+                self.pytex.add_created(Fig.external_file)
+        self._external_pending.append((ref, Fig.file_name, Fig.external_file))
+
+    def _external_batch_file(self):
+        """
+        The PDF the queued ``.pgf`` figures are compiled to when they can
+        not be split into separate files.
+        """
+        return os.path.join(self.fig_dir or self._base_path,
+                            'texfigure-{}-{}-pgf.pdf'.format(
+                                self.number, self._external_batches))
+
+    def _compile_external(self):
+        """
+        Compile the queued ``.pgf`` figures to PDFs.
+        """
+        pending, self._external_pending = self._external_pending, []
+        refs = dict((pdf_file, ref) for ref, pgf_file, pdf_file in pending
+                    if os.path.exists(pgf_file))
+        if not refs:
+            return
+
+        cache_dir = None
+        if self._cache_dir:
+            cache_dir = os.path.join(self._cache_dir, 'pgf')
+
+        start = default_timer()
+        if pending[0][2] == self._external_batch_file():
+            self._external_batches += 1
+            if compile_pgf_pages([pgf_file for _, pgf_file, _ in pending],
+                                 pending[0][2], cache_dir=cache_dir):
+                seconds = (default_timer() - start) / len(pending)
+                for ref, _, pdf_file in pending:
+                    self._build_report.add_save(ref, pdf_file, seconds)
+            return
+
+        compiled = compile_pgf([(pgf_file, pdf_file) for
+                                _, pgf_file, pdf_file in pending
+                                if pdf_file in refs],
+                               cache_dir=cache_dir)
+
+        # The batch is one LaTeX run, so its time is shared between figures.
+        seconds = (default_timer() - start) / max(len(compiled), 1)
+        for pdf_file in compiled:
+            self._build_report.add_save(refs[pdf_file], pdf_file, seconds)
+
+    def flush(self):
+        """
+        Wait for all figures being rendered in the background to be saved,
+        compile ``.pgf`` figures if ``externalize`` is set, and write the
+        figure registry to the cache.
+
+        Raises
+        ------
+
+        RuntimeError
+            If any of the figures failed to render or compile.
+        """
+        if self._render_queue is not None:
+            self._render_queue.flush()
+        self._compile_external()
+        self._figure_registry.sync()
+
+    def build_report(self):
+        """
+        Return the time spent on, and size of, each figure saved by this
+        manager, most expensive first.
+
+        The report is also written to ``texfigure-report-<number>.json`` in
+        the directory containing ``fig_dir`` at the end of the session.
+
+        Returns
+        -------
+
+        records : `list`
+            A `dict` for each figure, see
+            `texfigure.report.BuildReport.records`. Times are in seconds and
+            sizes in bytes.
+        """
+        return self._build_report.records()
+
+    def _session_end(self):
+        """
+        Finish any background renders and write the build report.
+        """
+        self.flush()
+        if not self.fig_dir or not self._build_report.records():
+            return
+
+        # The directory may have been removed before the interpreter exits,
+        # e.g. a temporary directory.
+        report_dir = os.path.dirname(os.path.normpath(self.fig_dir))
+        if os.path.isdir(report_dir):
+            self._build_report.write(
+                os.path.join(report_dir,
+                             'texfigure-report-{}.json'.format(self.number)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.flush()
+        finally:
+            if self._render_queue is not None:
+                self._render_queue.shutdown()
+
     def _save_mpl_figure(self, fig, filename, **kwargs):
         """
         A wrapper to save a matplotlib figure object to a file.
         """
 
-        fig.savefig(filename, **kwargs)
-
-        return filename
+        return save_mpl_figure(fig, filename, **kwargs)
 
     def _save_mayavi_figure(self, fig, filename, azimuth=153, elevation=62,
                             distance=400, focalpoint=[25., 63., 60.], aa=16,
@@ -569,6 +1405,8 @@ class Manager(object):
         """
         A wrapper to save a mayavi figure object
         """
+        from mayavi import mlab
+
         scene = fig.scene
 
         scene.anti_aliasing_frames = aa
@@ -590,10 +1428,89 @@ class Manager(object):
 
         return filename
 
+    def register_save_function(self, figure_type, save_function):
+        """
+        Add a function to save figures of a given type.
+
+        Parameters
+        ----------
+
+        figure_type : `type` or `str`
+            The figure type, or its fully qualified name.
+
+        save_function : callable
+            A function which accepts the figure object, a file name and any
+            keyword arguments and returns the file name as saved to disk.
+        """
+        self.savefigure_functions[figure_type] = save_function
+        self._save_function_cache.clear()
+
+    def get_save_function(self, fig):
+        """
+        Return the function used to save a figure object.
+
+        The most specific entry in `~texfigure.Manager.savefigure_functions`
+        in the method resolution order of the type of ``fig`` is used. If
+        there is none the ``texfigure.savers`` entry points are searched. The
+        result is cached per type.
+
+        Parameters
+        ----------
+
+        fig : object
+            The figure object.
+
+        Returns
+        -------
+
+        save_function : callable
+            The save function for this type of figure.
+
+        Raises
+        ------
+
+        TypeError
+            If no save function is known for this type of figure.
+        """
+        ftype = type(fig)
+        try:
+            return self._save_function_cache[ftype]
+        except KeyError:
+            pass
+
+        save_function = None
+        for atype in ftype.__mro__:
+            for key in (atype, _type_name(atype)):
+                if key in self.savefigure_functions:
+                    save_function = self.savefigure_functions[key]
+                    break
+            if save_function is not None:
+                break
+
+        else:
+            entry_points = _saver_entry_points()
+            for atype in ftype.__mro__:
+                name = _type_name(atype)
+                if name in entry_points:
+                    save_function = entry_points[name].load()
+                    self.savefigure_functions[name] = save_function
+                    break
+
+        if save_function is None:
+            raise TypeError("No save function is registered for figures of "
+                            "type {}".format(_type_name(ftype)))
+
+        self._save_function_cache[ftype] = save_function
+        return save_function
+
     def add_figure(self, ref, Fig):
         """
         Add the figure to the tracked files and increment the figure count.
 
+        Each reference is numbered by the order in which it was first
+        registered in this session, registering a reference again keeps its
+        number.
+
         Parameters
         ----------
         ref : `str`
@@ -605,7 +1522,13 @@ class Manager(object):
 
         self.pytex.add_created(Fig.file_name)
 
-        self._figure_registry[ref] = {'number': self.fig_count, 'Figure': Fig}
+        entry = self._figure_registry.session_entry(ref)
+        if entry is not None:
+            number = entry['number']
+        else:
+            number = self._figure_registry.session_count() + 1
+
+        self._figure_registry[ref] = {'number': number, 'Figure': Fig}
         self.fig_count += 1
 
     def save_figure(self, ref, fig=None, fname=None, fext='.pdf', **kwargs):
@@ -621,15 +1544,20 @@ class Manager(object):
 
         fig : object
             A figure object of a type that has an entry in the
-            `~texfigure.Manager.savefig_functions` dictionary. If None it will
+            `~texfigure.Manager.savefigure_functions` dictionary. If None it will
             be assumed that the current ``pyplot`` figure is to be used and
             `~matplotlib.pyplot.gcf` will be called.
 
         fname : `str`
-            The file name to be used, not including the extension or the path.
+            The file name to be used, not including the path. An extension in
+            ``fname`` is used instead of a single ``fext``, and replaced by
+            each extension if a list is given.
 
-        fext : `str`
-            The file extension to be used to save the file.
+        fext : `str` or `list`
+            The file extension to be used to save the file. If a list of
+            extensions is given the figure is saved in each format, the
+            returned `~texfigure.Figure` uses the first, and the other files
+            are added to the pytex tracked files.
 
         kwargs : `dict`
             Other keyword arguments are passed onto the save figure function.
@@ -644,19 +1572,112 @@ class Manager(object):
         if fig is None:
             fig = plt.gcf()
 
-        fname = self.make_figure_filename(ref, fname=fname, fext=fext,
-                                          fullpath=True)
+        fexts = [fext] if isinstance(fext, six.string_types) else list(fext)
+        if not fexts:
+            raise ValueError("At least one file extension must be given.")
+        if fname and len(fexts) > 1:
+            fname = os.path.splitext(fname)[0]
 
-        for atype in self.savefigure_functions.keys():
-            if issubclass(type(fig), atype):
-                fname = self.savefigure_functions[atype](fig, fname, **kwargs)
+        fnames = [self.make_figure_filename(ref, fname=fname, fext=ext,
+                                            fullpath=True)
+                  for ext in fexts]
 
-        Fig = Figure(fname, reference=ref)
+        save_function = self.get_save_function(fig)
+        fnames = self._render_figure(ref, save_function, fig, fnames, **kwargs)
+
+        start = default_timer()
+
+        for other in fnames[1:]:
+            self.pytex.add_created(other)
+
+        Fig = Figure(fnames[0], reference=ref)
+        if self.externalize and Fig.extension == '.pgf':
+            self._add_external(ref, Fig)
 
         self.add_figure(ref, Fig)
+        self._build_report.add_figure_time(ref, default_timer() - start)
+
+        self._record_dependencies(ref, fnames)
+
+        return Fig
+
+    def _record_dependencies(self, ref, outputs):
+        """
+        Record the data files used since the last figure was saved as the
+        dependencies of ``ref``.
+
+        The dependencies are only used to skip regenerating the figure of a
+        `~texfigure.Manager.figure` scope, so are only recorded, and the data
+        files hashed, when ``ref`` is saved inside its own scope.
+        """
+        scope = self._active_scope
+        if scope is not None and scope.ref == ref:
+            self._dependency_graph.record(ref, self._touched_files,
+                                          code=scope.code, outputs=outputs)
+        self._touched_files = []
 
+    def _restore_figure(self, ref, filename):
+        """
+        Register a previously saved figure file as ``ref``.
+        """
+        Fig = Figure(filename, reference=ref)
+        if self.externalize and Fig.extension == '.pgf':
+            self._add_external(ref, Fig)
+        self.add_figure(ref, Fig)
         return Fig
 
+    def figure(self, ref):
+        """
+        Return a context in which to generate the figure ``ref``.
+
+        The data files requested with `~texfigure.Manager.data_file` inside
+        the ``with`` block are recorded as the dependencies of the figure,
+        along with a hash of the source code of the block. When the manager
+        has a ``cache_dir`` this is persisted between runs, and if neither
+        the data files nor the code have changed since the figure was last
+        saved, the previous figure is registered with the manager and the
+        ``up_to_date`` attribute of the context is `True`.
+
+        Parameters
+        ----------
+
+        ref : `str`
+            The reference of the figure saved in the block.
+
+        Returns
+        -------
+
+        scope : `texfigure.dependencies.FigureScope`
+            The context manager.
+
+        Examples
+        --------
+
+        .. code-block:: python
+
+            with manager.figure('velocity') as scope:
+                if not scope.up_to_date:
+                    data = np.load(manager.data_file('velocity.npy'))
+                    fig, ax = plt.subplots()
+                    ax.plot(data)
+                    manager.save_figure('velocity', fig)
+
+            Fig = scope.figure
+
+        Notes
+        -----
+
+        Only the source of the ``with`` block is hashed, changes to
+        functions called from the block are not detected.
+        """
+        frame = sys._getframe(1)
+        source = block_source(frame.f_code.co_filename, frame.f_lineno)
+        code = None
+        if source is not None:
+            code = hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+        return FigureScope(self, ref, code=code)
+
     def get_figure(self, ref):
         """
         Get the `~texfigure.Figure` object corresponding to the given reference.
@@ -674,6 +1695,73 @@ class Manager(object):
 
         return self._figure_registry[ref]['Figure']
 
+    figure_macros_header = r"""% Generated by texfigure, changes will be overwritten.
+\providecommand{\texfigure}[1]{\csname texfigure@#1\endcsname}
+\providecommand{\texfigurenumber}[1]{\csname texfigure@number@#1\endcsname}
+"""
+
+    figure_macro_str = r"""\expandafter\long\expandafter\def\csname texfigure@{ref}\endcsname{{%{latex}}}
+\expandafter\def\csname texfigure@number@{ref}\endcsname{{{number}}}
+"""
+
+    def write_figure_macros(self, filename=None):
+        r"""
+        Write the LaTeX for every figure registered in this session to one
+        file, with a macro for each figure reference.
+
+        Figures only known from the registry of an earlier session, which
+        may since have been removed from the document, are left out.
+
+        After ``\input``-ing the file in the document, ``\texfigure{ref}``
+        includes the figure environment for ``ref`` without a PythonTeX
+        command for each figure, and ``\texfigurenumber{ref}`` expands to the
+        position of ``ref`` in the order the figures were first saved in
+        this session, which is not part of the figure file names.
+
+        Parameters
+        ----------
+
+        filename : `str`
+            The file to write, defaults to ``Chapter<number>-figures.tex`` in
+            ``fig_dir``.
+
+        Returns
+        -------
+
+        filename : `str`
+            The file written, which is added to the pytex created files.
+
+        Examples
+        --------
+
+        .. code-block:: latex
+
+            \begin{pycode}
+            manager.save_figure('plot1', fig)
+            ...
+            macros = manager.write_figure_macros()
+            \end{pycode}
+
+            \input{\py{macros}}
+
+            \texfigure{plot1}
+        """
+        if filename is None:
+            filename = os.path.join(self.fig_dir,
+                                    'Chapter{}-figures.tex'.format(self.number))
+
+        with io.open(filename, 'w', encoding='utf-8',
+                     buffering=1 << 16) as fobj:
+            fobj.write(six.text_type(self.figure_macros_header))
+            for ref, entry in self._figure_registry.session_items():
+                fobj.write(six.text_type(self.figure_macro_str.format(
+                    ref=ref, latex=entry['Figure']._repr_latex_(),
+                    number=entry['number'])))
+
+        self.pytex.add_created(filename)
+
+        return filename
+
     def get_multifigure(self, nrows, ncols, refs, reference=''):
         """
         Return a `texfigure.MultiFigure` object made up of a set